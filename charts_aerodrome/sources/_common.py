@@ -0,0 +1,418 @@
+"""
+Shared helpers for the aerodrome chart scrapers.
+
+The HTTP session is created once per process at import time, so the
+country modules share its connection pool.
+"""
+
+import asyncio
+import functools
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+
+# One pooled session shared by the scrapers (keep-alive across requests to the same host)
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=10,
+    # Connection errors and overloaded/throttled responses are retried with
+    # exponential backoff; once retries run out the last response is returned
+    # so the scrapers' own status handling still applies
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        raise_on_status=False,
+    ),
+)
+SESSION.mount('https://', _ADAPTER)
+SESSION.mount('http://', _ADAPTER)
+# Every encoding urllib3 can decode here: gzip/deflate, plus br/zstd when
+# the brotli/zstandard packages are installed (requests only sends gzip, deflate)
+SESSION.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+# On-disk cache of landing pages, revalidated with ETag / Last-Modified
+HTTP_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'charts_aerodrome_http_cache')
+
+# Parsed airport pages, one JSON file per country and AIRAC cycle
+AIRAC_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'skylink', 'aerodrome')
+_AIRAC_CACHE_LOCK = threading.Lock()
+# Characters kept from an AIRAC identifier in cache filenames
+_CACHE_KEY_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+# Characters of a link that quote_href leaves as they are, besides
+# letters, digits and '_.-~'; links made only of these skip quote()
+_HREF_SAFE_CHARS = '/:?&=#%'
+_SAFE_HREF_RE = re.compile(r'[A-Za-z0-9_.~/:?&=#%-]+')
+
+# Streamed responses are read and parsed in chunks of this many bytes
+_STREAM_CHUNK_SIZE = 65536
+# How much of the previous chunk a link scan keeps, so a section heading
+# spanning a chunk boundary is not lost (an unfinished href is kept whole)
+_STREAM_OVERLAP = 4096
+_HREF_OPEN = b'href="'
+# Heading of the section following AD 2.24 (charts related to an aerodrome)
+_AFTER_CHARTS_RE = re.compile(rb'AD[-\s]2\.25')
+
+
+def conditional_get(url, cache_dir=HTTP_CACHE_DIR, **kwargs):
+    """
+    Fetch a page body using a conditional GET against a copy cached on disk.
+
+    The ETag / Last-Modified validators of the last full response are stored
+    next to its body; on a 304 Not Modified the cached body is returned
+    without transferring the page again.
+
+    Args:
+        url: URL to fetch
+        cache_dir: Directory holding the cached bodies and validators
+        **kwargs: Extra arguments for SESSION.get (timeout, verify, headers, ...)
+
+    Returns:
+        bytes: Page body
+
+    Raises:
+        requests.HTTPError: If the server returns an error status
+    """
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    body_path = os.path.join(cache_dir, f"{key}.body")
+
+    base_headers = kwargs.pop('headers', None) or {}
+    headers = dict(base_headers)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            validators = json.load(f)
+    except (OSError, ValueError):
+        validators = {}
+
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    response = SESSION.get(url, headers=headers, **kwargs)
+
+    if response.status_code == 304 and validators:
+        try:
+            with open(body_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            # Cached body went missing - fetch unconditionally
+            response = SESSION.get(url, headers=base_headers, **kwargs)
+
+    response.raise_for_status()
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(body_path, 'wb') as f:
+                f.write(response.content)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'etag': etag, 'last_modified': last_modified}, f)
+        except OSError:
+            pass
+
+    return response.content
+
+
+def _airac_cache_path(country, airac, cache_dir):
+    return os.path.join(cache_dir, f"{country}_{_CACHE_KEY_RE.sub('_', airac).strip('_')}.json")
+
+
+def _load_airac_cache(country, airac, cache_dir):
+    try:
+        with open(_airac_cache_path(country, airac, cache_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_airac_cache(country, airac, icao_code, charts, cache_dir):
+    path = _airac_cache_path(country, airac, cache_dir)
+    with _AIRAC_CACHE_LOCK:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            entries = _load_airac_cache(country, airac, cache_dir)
+            entries[icao_code] = charts
+            # Write-then-rename so readers never see a partial file; dumps()
+            # uses the C encoder, which dump() bypasses by streaming chunks
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(entries))
+            os.replace(tmp_path, path)
+            # Pages from earlier AIRAC cycles are no longer current
+            for stale_path in glob.glob(os.path.join(cache_dir, f"{country}_*.json")):
+                if stale_path != path:
+                    os.remove(stale_path)
+        except OSError:
+            pass
+
+
+def airac_cached(country, maxsize=256, cache_dir=None):
+    """
+    Cache a per-airport chart lookup for the rest of its AIRAC cycle.
+    
+    Decorates fetch(icao_code, airac, *args) -> list of chart dicts, where
+    airac identifies the published edition (e.g. its date folder or base URL).
+    Results are memoized in-process keyed by all arguments, and stored in a
+    JSON file per country and AIRAC under AIRAC_CACHE_DIR so later runs skip
+    the download and parse too. Storing a new AIRAC removes the country's
+    files for older ones. Exceptions propagate and are not cached; empty
+    results are not written to disk.
+    
+    Args:
+        country: Cache file prefix (e.g. 'serbia')
+        maxsize: Size of the in-process LRU cache
+        cache_dir: Directory of the JSON files (default AIRAC_CACHE_DIR)
+        
+    Returns:
+        Decorator; the wrapped function returns a fresh copy of the charts
+        on every call and has a cache_clear() for the in-process cache
+    """
+    def decorator(fetch):
+        @functools.lru_cache(maxsize=maxsize)
+        def cached(icao_code, airac, *args):
+            directory = cache_dir or AIRAC_CACHE_DIR
+            charts = _load_airac_cache(country, airac, directory).get(icao_code)
+            if charts is None:
+                charts = fetch(icao_code, airac, *args)
+                # Misses (e.g. a 404) are only remembered in-process
+                if charts:
+                    _store_airac_cache(country, airac, icao_code, charts, directory)
+            return charts
+        
+        @functools.wraps(fetch)
+        def wrapper(icao_code, airac, *args):
+            return [dict(chart) for chart in cached(icao_code, airac, *args)]
+        
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
+
+
+def categorize_by_patterns(name, category_patterns, default):
+    """
+    Return the first category whose pattern matches the chart name.
+    
+    Args:
+        name: Chart name or filename
+        category_patterns: Sequence of (category, compiled regex) in priority order
+        default: Category returned when nothing matches
+        
+    Returns:
+        str: Chart category
+    """
+    for category, pattern in category_patterns:
+        if pattern.search(name):
+            return category
+    return default
+
+
+def declared_encoding(response):
+    """
+    Charset declared in a response's Content-Type header.
+    
+    Unlike response.encoding this does not fall back to ISO-8859-1 for text/*
+    responses, so parsers can sniff the document's own <meta charset> instead.
+    
+    Args:
+        response: requests response
+        
+    Returns:
+        str or None: Declared charset, if any
+    """
+    content_type = response.headers.get('Content-Type', '')
+    if 'charset=' not in content_type.lower():
+        return None
+    return response.encoding
+
+
+def parse_streamed(response):
+    """
+    Parse a response fetched with stream=True with lxml as its body arrives.
+    
+    A charset declared in the headers is honoured; otherwise lxml sniffs the
+    page's own declaration. A parser is made per call, as lxml parsers must
+    not be fed from several threads at once.
+    
+    Args:
+        response: requests response fetched with stream=True
+        
+    Returns:
+        lxml root element, or None for an empty page
+    """
+    parser = lxml_html.HTMLParser(encoding=declared_encoding(response))
+    for chunk in response.iter_content(_STREAM_CHUNK_SIZE):
+        parser.feed(chunk)
+    return parser.close()
+
+
+def stripped_text(element, separator=''):
+    """
+    Text of an lxml element with each text node stripped.
+    
+    Matches BeautifulSoup's get_text(separator, strip=True): whitespace-only
+    nodes are dropped and the rest joined with the separator.
+    
+    Args:
+        element: lxml element
+        separator: String placed between the text nodes
+        
+    Returns:
+        str: Joined text
+    """
+    return separator.join(filter(None, (text.strip() for text in element.itertext())))
+
+
+def scan_chart_links(response, href_re, is_chart=None):
+    """
+    Collect chart hrefs from a streamed eAIP airport page.
+    
+    Only the unmatched tail of the page is held between chunks. Reading stops
+    once the section following AD 2.24 is reached after at least one chart
+    link was found, so trailing sections are not downloaded.
+    
+    Args:
+        response: requests response opened with stream=True
+        href_re: Compiled bytes regex of href="..." links, target in group 1
+        is_chart: Predicate telling whether a collected href is a chart
+            (default: every href is)
+        
+    Returns:
+        Tuple of (list of href strings, number of bytes read)
+    """
+    links = []
+    found_chart = False
+    bytes_read = 0
+    buffer = b''
+    
+    for chunk in response.iter_content(_STREAM_CHUNK_SIZE):
+        bytes_read += len(chunk)
+        buffer += chunk
+        
+        last_end = 0
+        for match in href_re.finditer(buffer):
+            if found_chart and _AFTER_CHARTS_RE.search(buffer, last_end, match.start()):
+                return links, bytes_read
+            href = match.group(1).decode('utf-8', errors='replace')
+            links.append(href)
+            found_chart = found_chart or is_chart is None or is_chart(href)
+            last_end = match.end()
+        
+        if found_chart and _AFTER_CHARTS_RE.search(buffer, last_end):
+            break
+        
+        # Keep only the unmatched tail for the next chunk, extended back to
+        # the start of an href whose closing quote has not arrived yet
+        keep_from = max(last_end, len(buffer) - _STREAM_OVERLAP)
+        open_at = buffer.rfind(_HREF_OPEN, last_end)
+        if open_at != -1 and buffer.find(b'"', open_at + len(_HREF_OPEN)) == -1:
+            keep_from = min(keep_from, open_at)
+        buffer = buffer[keep_from:]
+    
+    return links, bytes_read
+
+
+def response_text(response, default='utf-8'):
+    """
+    Decode a response body without requests' charset detection.
+    
+    response.text runs charset_normalizer/chardet over the whole body when
+    the server declares no charset; the eAIP pages are UTF-8, so the
+    declared charset is used when present and UTF-8 otherwise.
+    
+    Args:
+        response: requests response
+        default: Encoding used when none is declared
+        
+    Returns:
+        str: Decoded body (undecodable bytes replaced)
+    """
+    try:
+        return response.content.decode(declared_encoding(response) or default, errors='replace')
+    except LookupError:
+        # Unknown charset name in the header
+        return response.content.decode(default, errors='replace')
+
+
+def quote_href(href):
+    """
+    URL-encode a relative chart link (spaces and special characters).
+    
+    Path separators, query/fragment delimiters and existing %-escapes are
+    kept, so the result can be passed to urljoin. Most eAIP links are plain
+    ASCII like "../../graphics/eAIP/LY_AD_2_LYBE_2-24-1_en.pdf", which need
+    no encoding; those are returned as-is without going through quote().
+    
+    Args:
+        href: Link target as found in the page
+        
+    Returns:
+        str: Encoded link
+    """
+    if _SAFE_HREF_RE.fullmatch(href):
+        return href
+    return quote(href, safe=_HREF_SAFE_CHARS)
+
+
+def map_threaded(func, args, max_workers=8):
+    """
+    Run a blocking scraper function once per argument on a thread pool.
+    
+    The calls are network-bound, so threads overlap their HTTP round trips;
+    the default of 8 workers stays within SESSION's connection pool. Pages
+    are parsed with lxml, whose C parser releases the GIL (fromstring and
+    the feed interface alike), so the parsing overlaps too and a process
+    pool would only add pickling of the results.
+    
+    Args:
+        func: Blocking function taking a single argument (e.g. an ICAO code)
+        args: Iterable of arguments
+        max_workers: Number of calls run in parallel
+        
+    Returns:
+        list: Results in the same order as args
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, args))
+
+
+async def gather_threaded(func, args, limit=8):
+    """
+    Run a blocking scraper function once per argument from async code.
+    
+    Calls run in worker threads so their HTTP requests overlap; at most
+    `limit` run at once, which keeps them within SESSION's connection pool.
+    
+    Args:
+        func: Blocking function taking a single argument (e.g. an ICAO code)
+        args: Iterable of arguments
+        limit: Maximum number of concurrent calls
+        
+    Returns:
+        list: Results in the same order as args
+    """
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def run(arg):
+        async with semaphore:
+            return await asyncio.to_thread(func, arg)
+    
+    return await asyncio.gather(*(run(arg) for arg in args))
@@ -18,17 +18,41 @@ Structure:
 - PDF links have class "ulink" with full URLs to docs.pansa.pl
 """
 
+import os
 import re
 import requests
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from urllib.parse import urljoin, quote, unquote
 import sys
+import traceback
+from functools import lru_cache
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, conditional_get
 
 
 # Base URLs
 MAIN_PAGE_URL = "https://www.ais.pansa.pl/en/publications/aip-poland/"
 EAIP_BASE_URL = "https://docs.pansa.pl/ais/eaipifr/"
 
+# Path segment that is already fully percent-encoded (nothing left to quote)
+_ENCODED_SEGMENT_RE = re.compile(r'(?:[A-Za-z0-9_.~-]|%[0-9A-Fa-f]{2})*')
+
+# Chart category keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'STANDARD DEPARTURE|SID|DEP CHART|DEPARTURE CHART', re.IGNORECASE)),
+    ('STAR', re.compile(r'STANDARD ARRIVAL|STAR|ARR CHART|ARRIVAL CHART', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|VOR|RNP|RNAV|LOC|NDB|DME|CIRCLING|IAC', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(
+        r'AERODROME CHART|AIRPORT CHART|PARKING|DOCKING|GROUND MOVEMENT|TAXI|APRON|AIRCRAFT STAND',
+        re.IGNORECASE,
+    )),
+)
+
 
 def get_latest_eaip_url():
     """
@@ -39,23 +63,21 @@ def get_latest_eaip_url():
              'https://docs.pansa.pl/ais/eaipifr/default_offline_2026-01-22.html'
     """
     try:
-        response = requests.get(MAIN_PAGE_URL, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
+        # The main page rarely changes between AIRAC cycles - revalidate a cached copy
+        soup = BeautifulSoup(conditional_get(MAIN_PAGE_URL, timeout=30), 'lxml')
         
         # Find the eAIP IFR link - it's in a table with link to docs.pansa.pl/ais/eaipifr
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if 'docs.pansa.pl/ais/eaipifr' in href and 'default_offline' in href:
-                return href
+        link = soup.select_one('a[href*="docs.pansa.pl/ais/eaipifr"][href*="default_offline"]')
+        if link:
+            return link['href']
         
         # Fallback: search for any eaipifr link
-        for link in soup.find_all('a', href=True):
+        link = soup.select_one('a[href*="eaipifr"][href$=".html"]')
+        if link:
             href = link['href']
-            if 'eaipifr' in href and href.endswith('.html'):
-                if href.startswith('http'):
-                    return href
-                return urljoin(MAIN_PAGE_URL, href)
+            if href.startswith('http'):
+                return href
+            return urljoin(MAIN_PAGE_URL, href)
         
         return None
         
@@ -64,6 +86,24 @@ def get_latest_eaip_url():
         return None
 
 
+def encode_airac_folder(folder):
+    """
+    URL-encode an AIRAC folder name taken from an href.
+    
+    Hrefs usually carry the folder already encoded (e.g. "AIRAC%20AMDT%2001-26_2026_01_22"),
+    in which case it is returned as-is instead of being decoded and re-encoded.
+    
+    Args:
+        folder: AIRAC folder name, raw or URL-encoded
+        
+    Returns:
+        str: URL-encoded folder name
+    """
+    if _ENCODED_SEGMENT_RE.fullmatch(folder):
+        return folder
+    return quote(unquote(folder), safe='')
+
+
 def get_currently_effective_airac_folder(eaip_url):
     """
     From the eAIP landing page, find the "Currently Effective Issue" AIRAC folder.
@@ -76,13 +116,13 @@ def get_currently_effective_airac_folder(eaip_url):
         str: AIRAC folder name (URL-encoded), e.g., "AIRAC%20AMDT%2001-26_2026_01_22"
     """
     try:
-        response = requests.get(eaip_url, timeout=30)
+        response = SESSION.get(eaip_url, timeout=30)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
+        soup = BeautifulSoup(response.content, 'lxml')
         
         # Find td with green background (currently effective)
         # Style contains "background-color:#ADFF2F"
-        green_cells = soup.find_all('td', style=lambda s: s and 'ADFF2F' in s.upper() if s else False)
+        green_cells = soup.select('td[style*="ADFF2F" i]')
         
         for cell in green_cells:
             # Find the link in the same cell or row
@@ -106,7 +146,7 @@ def get_currently_effective_airac_folder(eaip_url):
                     for part in parts:
                         if 'AIRAC' in part:
                             # URL encode the folder name
-                            return quote(unquote(part), safe='')
+                            return encode_airac_folder(part)
         
         # Fallback: look for any link with AIRAC in href
         for link in soup.find_all('a', href=True):
@@ -115,7 +155,7 @@ def get_currently_effective_airac_folder(eaip_url):
                 parts = href.split('/')
                 for part in parts:
                     if 'AIRAC' in part:
-                        return quote(unquote(part), safe='')
+                        return encode_airac_folder(part)
         
         return None
         
@@ -145,6 +185,7 @@ def get_airport_page_url(icao_code, airac_folder):
     return f"{EAIP_BASE_URL}{airac_folder}/eAIP/{encoded_page}"
 
 
+@lru_cache(maxsize=4096)
 def categorize_chart(chart_name):
     """
     Categorize chart based on its name.
@@ -155,40 +196,9 @@ def categorize_chart(chart_name):
     Returns:
         str: Chart category (SID/STAR/Approach/Airport Diagram/General)
     """
-    name_upper = chart_name.upper()
-    
-    # SID charts
-    if any(keyword in name_upper for keyword in [
-        'STANDARD DEPARTURE', 'SID', 'DEP CHART', 'DEPARTURE CHART'
-    ]):
-        return 'SID'
-    
-    # STAR charts
-    if any(keyword in name_upper for keyword in [
-        'STANDARD ARRIVAL', 'STAR', 'ARR CHART', 'ARRIVAL CHART'
-    ]):
-        return 'STAR'
-    
-    # Approach charts
-    if any(keyword in name_upper for keyword in [
-        'APPROACH', 'ILS', 'VOR', 'RNP', 'RNAV', 'LOC', 'NDB', 'DME',
-        'INSTRUMENT APPROACH', 'CIRCLING', 'PRECISION APPROACH', 'IAC'
-    ]):
-        return 'Approach'
-    
-    # Airport diagrams / Ground charts
-    if any(keyword in name_upper for keyword in [
-        'AERODROME CHART', 'AIRPORT CHART', 'PARKING', 'DOCKING',
-        'GROUND MOVEMENT', 'TAXI', 'APRON', 'AIRCRAFT STAND'
-    ]):
-        return 'Airport Diagram'
-    
-    # VFR charts
-    if any(keyword in name_upper for keyword in ['VFR', 'VISUAL']):
-        return 'General'
-    
-    # Everything else (obstacles, terrain, etc.)
-    return 'General'
+    # Categories are checked in priority order; VFR, obstacle, terrain etc.
+    # charts fall through to General
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code):
@@ -225,24 +235,24 @@ def get_aerodrome_charts(icao_code):
         airport_url = get_airport_page_url(icao_code, airac_folder)
         print(f"Fetching airport page: {airport_url}")
         
-        response = requests.get(airport_url, timeout=30)
+        response = SESSION.get(airport_url, timeout=30)
         if response.status_code == 404:
             print(f"Airport {icao_code} not found in Poland eAIP")
             return charts
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.text, 'lxml')
-        
         # Step 4: Find the charts table (AD 2.24 section)
         # Tables have class containing "CHARTS_TABLE"
-        charts_tables = soup.find_all('table', class_=lambda c: c and 'CHARTS_TABLE' in c if c else False)
+        # The airport page is large, so it is parsed with lxml directly (no BeautifulSoup wrappers)
+        tree = lxml_html.fromstring(response.content)
+        charts_tables = tree.xpath('//table[contains(@class, "CHARTS_TABLE")]')
         
         if not charts_tables:
             # Fallback: find any table in AD 2.24 section
             # Look for header containing "Charts" or "MAPY"
-            for table in soup.find_all('table'):
-                header = table.find('th')
-                if header and ('Charts' in header.get_text() or 'MAPY' in header.get_text()):
+            for table in tree.iter('table'):
+                header = table.find('.//th')
+                if header is not None and ('Charts' in header.text_content() or 'MAPY' in header.text_content()):
                     charts_tables.append(table)
         
         if not charts_tables:
@@ -250,46 +260,33 @@ def get_aerodrome_charts(icao_code):
             return charts
         
         # Step 5: Extract chart links from the table(s)
-        seen_urls = set()
+        # Keyed by URL: de-duplicates while preserving page order
+        charts_by_url = {}
+        icao_prefix_re = re.compile(rf'^{re.escape(icao_code)}\s*-?\s*')
         
         for table in charts_tables:
-            rows = table.find_all('tr')
+            # PDF links in the second cell of non-header rows, in document order
+            pdf_links = table.xpath('.//tr[not(.//th)]/td[2]//a[contains(translate(@href, "PDF", "pdf"), ".pdf")]')
+            last_row = None
             
-            for row in rows:
-                # Skip header rows
-                if row.find('th'):
-                    continue
-                
-                cells = row.find_all('td')
-                if len(cells) < 2:
+            for pdf_link in pdf_links:
+                # One chart per row - use the first PDF link only
+                row = next(pdf_link.iterancestors('tr'))
+                if row is last_row:
                     continue
+                last_row = row
                 
                 # First cell contains chart name (in nested spans)
-                name_cell = cells[0]
-                chart_name = name_cell.get_text(strip=True)
+                name_cell = row.find('.//td')
+                chart_name = ''.join(text.strip() for text in name_cell.itertext())
                 
                 # Clean up chart name - remove ICAO prefix if duplicated
-                chart_name = re.sub(rf'^{icao_code}\s*-?\s*', '', chart_name)
-                chart_name = chart_name.strip()
+                chart_name = icao_prefix_re.sub('', chart_name).strip()
                 
                 if not chart_name:
                     continue
                 
-                # Second cell contains PDF link
-                link_cell = cells[1]
-                pdf_link = link_cell.find('a', class_='ulink', href=True)
-                
-                if not pdf_link:
-                    pdf_link = link_cell.find('a', href=True)
-                
-                if not pdf_link:
-                    continue
-                
-                href = pdf_link['href']
-                
-                # Skip non-PDF links
-                if '.pdf' not in href.lower():
-                    continue
+                href = pdf_link.get('href')
                 
                 # Build full URL if relative
                 if href.startswith('http'):
@@ -298,29 +295,26 @@ def get_aerodrome_charts(icao_code):
                     chart_url = urljoin(airport_url, href)
                 
                 # URL-encode spaces and special characters in the path
-                # Split URL into parts, encode the path portion
+                # Encode everything before the query/fragment, keeping existing %XX escapes
                 if ' ' in chart_url:
-                    # Parse URL and encode spaces in path
-                    from urllib.parse import urlsplit, urlunsplit
-                    parts = urlsplit(chart_url)
-                    encoded_path = quote(unquote(parts.path), safe='/:')
-                    chart_url = urlunsplit((parts.scheme, parts.netloc, encoded_path, parts.query, parts.fragment))
+                    end = min((i for i in (chart_url.find('?'), chart_url.find('#')) if i != -1),
+                              default=len(chart_url))
+                    chart_url = quote(chart_url[:end], safe='/:%') + chart_url[end:]
                 
                 # Skip duplicates
-                if chart_url in seen_urls:
+                if chart_url in charts_by_url:
                     continue
-                seen_urls.add(chart_url)
                 
                 # Categorize the chart
                 chart_type = categorize_chart(chart_name)
                 
-                charts.append({
+                charts_by_url[chart_url] = {
                     'name': chart_name,
                     'url': chart_url,
                     'type': chart_type
-                })
+                }
         
-        return charts
+        return list(charts_by_url.values())
         
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 404:
@@ -330,7 +324,6 @@ def get_aerodrome_charts(icao_code):
         return charts
     except Exception as e:
         print(f"Error scraping {icao_code}: {e}")
-        import traceback
         traceback.print_exc()
         return charts
 
@@ -4,15 +4,31 @@ Portugal eAIP Scraper
 Scrapes aerodrome charts from Portugal AIP following Eurocontrol structure
 """
 
-import requests
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from urllib.parse import urljoin, quote
+import os
 import re
 import sys
+import traceback
+from functools import lru_cache
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, stripped_text
 
 
 BASE_URL = "https://ais.nav.pt/wp-content/uploads/AIS_Files/eAIP_Current/eAIP_Online/eAIP/html/eAIP/"
 
+# Chart category keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|STANDARD DEPARTURE|STANDARD INSTRUMENT DEPARTURE', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|STANDARD ARRIVAL|STANDARD INSTRUMENT ARRIVAL', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|LOC|NDB|RNP|GLS|VOR|RNAV|DME', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(r'AERODROME CHART|GROUND MOVEMENT|PARKING|VISUAL APPROACH|DOCKING', re.IGNORECASE)),
+)
+
 
 def get_airport_page_url(icao_code):
     """Get the URL for a specific airport's AD 2 page"""
@@ -21,24 +37,10 @@ def get_airport_page_url(icao_code):
     return urljoin(BASE_URL, airport_page)
 
 
+@lru_cache(maxsize=4096)
 def categorize_chart(chart_name):
     """Categorize chart based on its name"""
-    chart_name_upper = chart_name.upper()
-    
-    if 'SID' in chart_name_upper or 'STANDARD DEPARTURE' in chart_name_upper or 'STANDARD INSTRUMENT DEPARTURE' in chart_name_upper:
-        return 'SID'
-    elif 'STAR' in chart_name_upper or 'STANDARD ARRIVAL' in chart_name_upper or 'STANDARD INSTRUMENT ARRIVAL' in chart_name_upper:
-        return 'STAR'
-    elif 'APPROACH' in chart_name_upper or 'ILS' in chart_name_upper or 'LOC' in chart_name_upper \
-            or 'NDB' in chart_name_upper or 'RNP' in chart_name_upper or 'GLS' in chart_name_upper \
-            or 'VOR' in chart_name_upper or 'RNAV' in chart_name_upper or 'DME' in chart_name_upper:
-        return 'Approach'
-    elif 'AERODROME CHART' in chart_name_upper or 'GROUND MOVEMENT' in chart_name_upper \
-            or 'PARKING' in chart_name_upper or 'VISUAL APPROACH' in chart_name_upper \
-            or 'AIRCRAFT PARKING' in chart_name_upper or 'DOCKING' in chart_name_upper:
-        return 'Airport Diagram'
-    else:
-        return 'General'
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code):
@@ -58,46 +60,39 @@ def get_aerodrome_charts(icao_code):
         airport_url = get_airport_page_url(icao_code)
         
         # Get the airport page
-        response = requests.get(airport_url, timeout=30)
+        response = SESSION.get(airport_url, timeout=30)
         if response.status_code != 200:
             print(f"Error: Got status code {response.status_code}")
             return charts
         
-        soup = BeautifulSoup(response.text, 'lxml')
+        tree = lxml_html.fromstring(response.content)
         
         # Find AD 2.24 section (charts section)
-        # Look for all PDF links in the page
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            
-            # Only process PDF links
-            if '.pdf' not in href.lower():
-                continue
+        # Look for all PDF links inside table cells
+        for link in tree.xpath('//td//a[contains(translate(@href, "PDF", "pdf"), ".pdf")]'):
+            href = link.get('href')
             
             # Get the chart name from the row
-            td_parent = link.find_parent('td')
-            if not td_parent:
-                continue
-            
-            tr_parent = td_parent.find_parent('tr')
-            if not tr_parent:
+            td_parent = next(link.iterancestors('td'))
+            tr_parent = next(td_parent.iterancestors('tr'), None)
+            if tr_parent is None:
                 continue
             
             # Find the previous sibling row which contains the chart name
-            prev_row = tr_parent.find_previous_sibling('tr')
+            prev_row = next(tr_parent.itersiblings('tr', preceding=True), None)
             chart_name = None
             
-            if prev_row:
-                name_td = prev_row.find('td')
-                if name_td:
-                    chart_name = name_td.get_text(strip=True)
+            if prev_row is not None:
+                name_td = prev_row.find('.//td')
+                if name_td is not None:
+                    chart_name = stripped_text(name_td)
             
             # If we didn't find a name in the previous row, try the current row
             if not chart_name:
                 # Look for text in the same row
-                tds = tr_parent.find_all('td')
+                tds = tr_parent.iterdescendants('td')
                 for td in tds:
-                    text = td.get_text(strip=True)
+                    text = stripped_text(td)
                     if text and text != href and not text.startswith('http'):
                         chart_name = text
                         break
@@ -112,12 +107,12 @@ def get_aerodrome_charts(icao_code):
             full_url = urljoin(airport_url, href)
             
             # URL encode the PDF filename (spaces and special characters)
-            # Split URL into base and filename, encode filename only
-            url_parts = full_url.rsplit('/', 1)
-            if len(url_parts) == 2:
-                base_url, filename = url_parts
-                encoded_filename = quote(filename, safe='')
-                full_url = f"{base_url}/{encoded_filename}"
+            # Encode the last path segment only, leaving any query string intact
+            slash = full_url.rfind('/')
+            end = full_url.find('?', slash)
+            if end == -1:
+                end = len(full_url)
+            full_url = full_url[:slash + 1] + quote(full_url[slash + 1:end], safe='%') + full_url[end:]
             
             # Categorize the chart
             chart_type = categorize_chart(chart_name)
@@ -132,7 +127,6 @@ def get_aerodrome_charts(icao_code):
         
     except Exception as e:
         print(f"Error fetching charts: {e}")
-        import traceback
         traceback.print_exc()
         return charts
 
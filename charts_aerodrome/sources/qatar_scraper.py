@@ -7,11 +7,20 @@ https://www.caa.gov.qa/en/aeronautical-information-management
 Eurocontrol-style eAIP with standard AD-2.24 charts section.
 """
 
+import os
 import re
 import sys
+import traceback
+from functools import lru_cache
 import requests
 from urllib.parse import urljoin
 
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, conditional_get, scan_chart_links
+
 # Disable SSL warnings
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,19 +29,31 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 CAA_AIM_PAGE = "https://www.caa.gov.qa/en/aeronautical-information-management"
 EAIP_BASE = "https://www.aim.gov.qa/eaip"
 
+# Compiled once at import; run against raw (undecoded) page bytes
+_AIRAC_DATE_RE = re.compile(rb'(\d{4}-\d{2}-\d{2})-AIRAC')
+# Chart PDF hrefs; AD-2 text document PDFs under /pdf/ (not charts, often 404) never match
+_CHART_HREF_RE = re.compile(rb'href="((?![^"]*/pdf/)[^"]*\.pdf)"', re.IGNORECASE)
+
+# Chart category keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR', re.IGNORECASE)),
+    ('APP', re.compile(r'IAC|ILS|RNP|VOR', re.IGNORECASE)),
+    ('GND', re.compile(r'ADC|CHART|AOC|APDC|PARK|DOCK|PATC', re.IGNORECASE)),
+)
+
 
 def get_latest_airac_date(verbose=False):
     """Get the latest AIRAC effective date from the CAA AIM page."""
     try:
-        response = requests.get(CAA_AIM_PAGE, verify=False, timeout=30)
-        response.raise_for_status()
+        # Revalidate a cached copy of the AIM page instead of refetching it every time
+        content = conditional_get(CAA_AIM_PAGE, verify=False, timeout=30)
         
-        # Find all AIRAC dates in the page
-        airac_dates = re.findall(r'(\d{4}-\d{2}-\d{2})-AIRAC', response.text)
+        # Most recent AIRAC date in the page (ISO dates compare lexically)
+        latest = max((m.group(1) for m in _AIRAC_DATE_RE.finditer(content)), default=None)
         
-        if airac_dates:
-            # Get the most recent date
-            latest = sorted(set(airac_dates), reverse=True)[0]
+        if latest:
+            latest = latest.decode('ascii')
             if verbose:
                 print(f"Found latest AIRAC date: {latest}")
             return latest
@@ -59,7 +80,6 @@ def get_aerodrome_charts(icao_code, verbose=False):
         List of dictionaries with 'name', 'url', and 'type' keys
     """
     icao_code = icao_code.upper()
-    charts = []
     
     try:
         # Get the latest AIRAC date
@@ -76,58 +96,51 @@ def get_aerodrome_charts(icao_code, verbose=False):
         if verbose:
             print(f"Fetching airport page: {airport_page_url}")
         
-        response = requests.get(airport_page_url, verify=False, timeout=30)
-        
-        if response.status_code == 404:
-            if verbose:
-                print(f"Airport {icao_code} not found in Qatar eAIP")
-            return []
-        
-        response.raise_for_status()
-        html_content = response.text
+        with SESSION.get(airport_page_url, verify=False, timeout=30, stream=True) as response:
+            if response.status_code == 404:
+                if verbose:
+                    print(f"Airport {icao_code} not found in Qatar eAIP")
+                return []
+            
+            response.raise_for_status()
+            
+            # Find all chart PDF links (hrefs are ASCII/UTF-8 in the eAIP pages)
+            pdf_links, bytes_read = scan_chart_links(response, _CHART_HREF_RE)
         
         if verbose:
-            print(f"Airport page fetched ({len(html_content)} bytes)")
-        
-        # Find all PDF links
-        pdf_pattern = re.compile(r'href="([^"]*\.pdf)"', re.IGNORECASE)
-        pdf_links = pdf_pattern.findall(html_content)
+            print(f"Airport page fetched ({bytes_read} bytes)")
         
         if verbose:
             print(f"Found {len(pdf_links)} PDF links")
         
-        # Process each PDF link
-        seen_urls = set()
+        # Process each PDF link; keyed by URL to de-duplicate while preserving order
+        charts_by_url = {}
         for pdf_href in pdf_links:
-            # Skip AD-2 text document PDFs (not charts, often 404)
-            if '/pdf/' in pdf_href or pdf_href.startswith('../../pdf/'):
-                continue
-            
             # Resolve relative URL
             pdf_url = urljoin(airport_page_url, pdf_href)
             
             # Skip duplicates
-            if pdf_url in seen_urls:
+            if pdf_url in charts_by_url:
                 continue
-            seen_urls.add(pdf_url)
             
             # Extract chart name from filename
-            filename = pdf_href.split('/')[-1]
-            chart_name = filename.replace('.pdf', '').replace('_', ' ')
+            filename = pdf_href[pdf_href.rfind('/') + 1:]
+            stem = filename[:-4] if filename.endswith('.pdf') else filename
+            chart_name = stem.replace('_', ' ')
             
             # Categorize the chart
             chart_type = categorize_chart(filename)
             
-            charts.append({
+            charts_by_url[pdf_url] = {
                 'name': chart_name,
                 'url': pdf_url,
                 'type': chart_type
-            })
+            }
         
         if verbose:
-            print(f"Processed {len(charts)} unique charts")
+            print(f"Processed {len(charts_by_url)} unique charts")
         
-        return charts
+        return list(charts_by_url.values())
         
     except requests.RequestException as e:
         if verbose:
@@ -136,31 +149,14 @@ def get_aerodrome_charts(icao_code, verbose=False):
     except Exception as e:
         if verbose:
             print(f"Error: {e}")
-            import traceback
             traceback.print_exc()
         return []
 
 
+@lru_cache(maxsize=4096)
 def categorize_chart(filename):
     """Categorize chart based on filename."""
-    filename_upper = filename.upper()
-    
-    if 'SID' in filename_upper:
-        return 'SID'
-    elif 'STAR' in filename_upper:
-        return 'STAR'
-    elif 'IAC' in filename_upper or 'ILS' in filename_upper or 'RNP' in filename_upper or 'VOR' in filename_upper:
-        return 'APP'
-    elif 'ADC' in filename_upper or 'AD CHART' in filename_upper or 'CHART' in filename_upper.replace('_', ' '):
-        return 'GND'
-    elif 'AOC' in filename_upper or 'APDC' in filename_upper or 'PARK' in filename_upper or 'DOCK' in filename_upper:
-        return 'GND'
-    elif 'PATC' in filename_upper:
-        return 'GND'
-    elif 'ATSMAC' in filename_upper or 'BIRD' in filename_upper:
-        return 'GEN'
-    else:
-        return 'GEN'
+    return categorize_by_patterns(filename, _CATEGORY_PATTERNS, 'GEN')
 
 
 if __name__ == "__main__":
@@ -4,37 +4,111 @@ Romania eAIP Scraper
 Scrapes aerodrome charts from Romania AIP following Eurocontrol structure
 """
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import html
+from lxml import html as lxml_html
 from urllib.parse import urljoin, quote
+import os
 import re
 import sys
+import time
+from functools import lru_cache
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, declared_encoding, gather_threaded, response_text
 
 
 BASE_URL = "https://aisro.ro/aip/"
 
+# The AIP portal page is re-read at most once per hour; the TOC is keyed by AIP URL
+_CACHE_TTL = 3600
+
+# Marker comment that starts each airport's block in the AD TOC
+_AIRPORT_MARKER_RE = re.compile(r'<!-- #+\s*(\w{4})\s+#+ -->')
+_NEXT_AIRPORT_RE = re.compile(r'<!-- ################################ [A-Z]{4} ################################ -->')
+# Heading of the next AD 2.x section
+_NEXT_SECTION_RE = re.compile(r'<div class="H3">.*?AD 2\.\d+.*?</div>', re.DOTALL)
+# <a ... href="...pdf">NAME</a> links in the AD 2.24 section
+_PDF_LINK_RE = re.compile(r'<a\s[^>]*?href="([^"]+\.pdf)"[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+# Inline tags inside link text (e.g. <span>)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# Chart type keywords, checked in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|STANDARD DEPARTURE|STANDARD INSTRUMENT DEPARTURE', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|STANDARD ARRIVAL|STANDARD INSTRUMENT ARRIVAL', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|LOC|NDB|RNP|VOR|RNAV', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(
+        r'AERODROME CHART|GROUND MOVEMENT|PARKING|DOCKING|VISUAL APPROACH|AIRCRAFT PARKING',
+        re.IGNORECASE,
+    )),
+)
+
+
+@lru_cache(maxsize=256)
+def _chart_section_re(icao_code):
+    """Compiled AD 2.24 (charts related to an aerodrome) heading for one airport"""
+    return re.compile(rf'AD 2\.24</span>.*?{re.escape(icao_code)}.*?Charts? related', re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_aip_url(ttl_bucket):
+    """Resolve the latest AIP URL from the portal page (cached per TTL bucket)"""
+    response = SESSION.get(f"{BASE_URL}aip.php", timeout=30)
+    encoding = declared_encoding(response)
+    parser = lxml_html.HTMLParser(encoding=encoding) if encoding else None
+    tree = lxml_html.fromstring(response.content, parser=parser)
+    
+    # Find the "Click here to access AIP ROMANIA" link
+    for link in tree.xpath('//a[@href][contains(string(.), "Click here to access AIP ROMANIA")]'):
+        href = link.get('href')
+        # Returns something like "2026-01-01/index.html"
+        aip_dir = href.split('/')[0]
+        return f"{BASE_URL}{aip_dir}/html/en/"
+    
+    # Raised rather than returned so a miss is not cached
+    raise LookupError("AIP ROMANIA link not found")
+
 
 def get_latest_aip_url():
     """Get the URL of the latest Romania AIP"""
     try:
-        response = requests.get(f"{BASE_URL}aip.php", timeout=30)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find the "Click here to access AIP ROMANIA" link
-        for link in soup.find_all('a', href=True):
-            if 'Click here to access AIP ROMANIA' in link.get_text():
-                href = link['href']
-                # Returns something like "2026-01-01/index.html"
-                aip_dir = href.split('/')[0]
-                return f"{BASE_URL}{aip_dir}/html/en/"
-        
+        return _fetch_latest_aip_url(int(time.time() // _CACHE_TTL))
+    except LookupError:
         return None
-        
     except Exception as e:
         print(f"Error getting latest AIP URL: {e}")
         return None
 
 
+@lru_cache(maxsize=1)
+def _fetch_ad_toc(base_url):
+    """Fetch the AD TOC of one AIP edition (cached until the AIP URL changes)"""
+    response = SESSION.get(urljoin(base_url, "aip_toc_ad.html"), timeout=30)
+    if response.status_code != 200:
+        raise LookupError(f"Error: Got status code {response.status_code}")
+    return response_text(response)
+
+
+@lru_cache(maxsize=1)
+def _airport_sections(toc_html):
+    """Map each ICAO code to the (start, end) offsets of its block in the AD TOC"""
+    sections = {}
+    for marker in _AIRPORT_MARKER_RE.finditer(toc_html):
+        icao_code = marker.group(1).upper()
+        if icao_code in sections:
+            continue
+        # The block runs until the next airport comment
+        start = marker.start()
+        next_airport_match = _NEXT_AIRPORT_RE.search(toc_html, start + 100)
+        end = next_airport_match.start() if next_airport_match else len(toc_html)
+        sections[icao_code] = (start, end)
+    return sections
+
+
 def get_ad_toc_content():
     """Get the AD table of contents with all airports and charts"""
     try:
@@ -42,15 +116,11 @@ def get_ad_toc_content():
         if not base_url:
             return None, None
         
-        toc_url = urljoin(base_url, "aip_toc_ad.html")
-        response = requests.get(toc_url, timeout=30)
-        
-        if response.status_code != 200:
-            print(f"Error: Got status code {response.status_code}")
-            return None, None
-        
-        return response.text, base_url
+        return _fetch_ad_toc(base_url), base_url
         
+    except LookupError as e:
+        print(e)
+        return None, None
     except Exception as e:
         print(f"Error getting AD TOC: {e}")
         return None, None
@@ -58,22 +128,28 @@ def get_ad_toc_content():
 
 def categorize_chart(chart_name):
     """Categorize chart based on its name"""
-    chart_name_upper = chart_name.upper()
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
+
+
+def _chart_from_link(match, base_url, dir_urls):
+    """Build the chart entry for one PDF link match in an AD 2.24 section"""
+    href = html.unescape(match.group(1))
+    chart_name = html.unescape(_TAG_RE.sub('', match.group(2))).strip()
     
-    if 'SID' in chart_name_upper or 'STANDARD DEPARTURE' in chart_name_upper or 'STANDARD INSTRUMENT DEPARTURE' in chart_name_upper:
-        return 'SID'
-    elif 'STAR' in chart_name_upper or 'STANDARD ARRIVAL' in chart_name_upper or 'STANDARD INSTRUMENT ARRIVAL' in chart_name_upper:
-        return 'STAR'
-    elif 'APPROACH' in chart_name_upper or 'ILS' in chart_name_upper or 'LOC' in chart_name_upper \
-            or 'NDB' in chart_name_upper or 'RNP' in chart_name_upper or 'VOR' in chart_name_upper \
-            or 'RNAV' in chart_name_upper:
-        return 'Approach'
-    elif 'AERODROME CHART' in chart_name_upper or 'GROUND MOVEMENT' in chart_name_upper \
-            or 'PARKING' in chart_name_upper or 'DOCKING' in chart_name_upper \
-            or 'VISUAL APPROACH' in chart_name_upper or 'AIRCRAFT PARKING' in chart_name_upper:
-        return 'Airport Diagram'
-    else:
-        return 'General'
+    # Build full URL with the PDF filename URL-encoded. Only the directory
+    # part needs resolving against base_url, and charts share a handful
+    # of directories, so each is joined once (dir_urls is per section).
+    slash = href.rfind('/')
+    dirpart, filename = href[:slash + 1], href[slash + 1:]
+    dir_url = dir_urls.get(dirpart)
+    if dir_url is None:
+        dir_url = dir_urls[dirpart] = urljoin(base_url, dirpart)
+    
+    return {
+        'name': chart_name,
+        'url': f"{dir_url}{quote(filename, safe='')}",
+        'type': categorize_chart(chart_name)
+    }
 
 
 def get_aerodrome_charts(icao_code):
@@ -95,82 +171,47 @@ def get_aerodrome_charts(icao_code):
             print(f"Could not get AD TOC content")
             return charts
         
-        soup = BeautifulSoup(toc_html, 'html.parser')
-        
         # Find all links with ICAO code and AD 2.24
         all_text = toc_html
         
         # Find the airport section by looking for the HTML comment marker
-        # (e.g., "<!-- ################################ LRBS ################################ -->")
-        comment_pattern = rf'<!-- #+\s*{icao_code}\s+#+ -->'
-        comment_match = re.search(comment_pattern, all_text, re.IGNORECASE)
+        # (e.g., "<!-- ################################ LRBS ################################ -->").
+        # The section offsets are indexed once per TOC; all searches below run on
+        # all_text with pos/endpos, so no substrings are copied out of the TOC.
+        section = _airport_sections(all_text).get(icao_code.upper())
         
-        if not comment_match:
+        if not section:
             print(f"Could not find airport section for {icao_code}")
             return charts
         
-        # Find where this airport's section ends (next airport comment)
-        search_start = comment_match.start()
-        next_airport_pattern = r'<!-- ################################ [A-Z]{4} ################################ -->'
-        next_airport_match = re.search(next_airport_pattern, all_text[search_start+100:])
-        
-        if next_airport_match:
-            search_end = search_start + 100 + next_airport_match.start()
-        else:
-            search_end = len(all_text)
+        search_start, search_end = section
         
         # Now search for AD 2.24 within this airport's section only
-        airport_section = all_text[search_start:search_end]
-        chart_pattern = rf'AD 2\.24</span>.*?{icao_code}.*?Charts? related'
-        chart_match = re.search(chart_pattern, airport_section, re.IGNORECASE | re.DOTALL)
+        chart_match = _chart_section_re(icao_code).search(all_text, search_start, search_end)
         
         if not chart_match:
             print(f"Could not find AD 2.24 section for {icao_code}")
             return charts
         
-        # Get the position where charts start (relative to all_text)
-        start_pos = search_start + chart_match.end()
+        # Get the position where charts start
+        start_pos = chart_match.end()
         
         # Extract the section after AD 2.24 until the next major section
         # Find the next airport or end of AD 2 section
-        next_section_pattern = r'<div class="H3">.*?AD 2\.\d+.*?</div>'
-        next_match = re.search(next_section_pattern, all_text[start_pos:], re.DOTALL)
+        next_match = _NEXT_SECTION_RE.search(all_text, start_pos)
         
         if next_match:
-            end_pos = start_pos + next_match.start()
-            section_html = all_text[start_pos:end_pos]
+            end_pos = next_match.start()
         else:
             # Take a reasonable chunk (next 50000 chars)
-            section_html = all_text[start_pos:start_pos + 50000]
-        
-        # Parse the section to find all PDF links
-        section_soup = BeautifulSoup(section_html, 'html.parser')
-        
-        for link in section_soup.find_all('a', href=True):
-            href = link['href']
-            if href.endswith('.pdf'):
-                chart_name = link.get_text(strip=True)
-                
-                # Build full URL
-                full_url = urljoin(base_url, href)
-                
-                # URL encode the PDF filename
-                url_parts = full_url.rsplit('/', 1)
-                if len(url_parts) == 2:
-                    base_part, filename = url_parts
-                    encoded_filename = quote(filename, safe='')
-                    full_url = f"{base_part}/{encoded_filename}"
-                
-                # Categorize the chart
-                chart_type = categorize_chart(chart_name)
-                
-                charts.append({
-                    'name': chart_name,
-                    'url': full_url,
-                    'type': chart_type
-                })
+            end_pos = start_pos + 50000
         
-        return charts
+        # Build a chart entry for every PDF link in the section
+        dir_urls = {}
+        return [
+            _chart_from_link(match, base_url, dir_urls)
+            for match in _PDF_LINK_RE.finditer(all_text, start_pos, end_pos)
+        ]
         
     except Exception as e:
         print(f"Error scraping {icao_code}: {e}")
@@ -179,6 +220,25 @@ def get_aerodrome_charts(icao_code):
         return charts
 
 
+async def get_aerodrome_charts_many_async(icao_codes):
+    """
+    Get aerodrome charts for several ICAO codes from async code
+    
+    The portal page and AD TOC are fetched once up front; the per-airport
+    lookups then run concurrently in worker threads.
+    
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    await asyncio.to_thread(get_ad_toc_content)
+    results = await gather_threaded(get_aerodrome_charts, icao_codes)
+    return dict(zip(icao_codes, results))
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python romania_scraper.py <ICAO_CODE>")
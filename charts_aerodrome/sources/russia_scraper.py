@@ -4,10 +4,52 @@ Fetches aerodrome charts from Russia's CAIGA AIP system.
 Based on http://www.caiga.ru/common/AirInter/validaip/html/menueng.htm
 """
 
+import asyncio
 import requests
+import os
 import re
+import sys
 from typing import List, Dict
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import categorize_by_patterns, declared_encoding
+
+
+# Any menu script call; quoted arguments may contain parentheses
+_MENU_TOKEN_RE = re.compile(r'Item(Begin|Link|End)\(((?:"[^"]*"|[^")])*)\);')
+# Menu script entries, e.g. ItemBegin("5159", "","UUEE. МОСКВА (ШЕРЕМЕТЬЕВО)");
+_ITEM_BEGIN_RE = re.compile(r'ItemBegin\("(\d+)",\s*"[^"]*",\s*"([^"]+)"\);')
+# e.g. ItemLink("../aip/ad/ad2/uuee/1-ad2-rus-uuee-txt.pdf","DATA, TEXTS, TABLES");
+_ITEM_LINK_RE = re.compile(r'ItemLink\("([^"]+)",\s*"([^"]+)"\);')
+# Number prefix on chart titles, e.g. "(31) "
+_NUM_PREFIX_RE = re.compile(r'^\(\d+\)\s*')
+
+# Chart type keywords (Russian and English), checked in priority order
+_CATEGORY_PATTERNS = (
+    ('sid', re.compile(
+        r'sid|сид|вылет|departure|стандартного вылета|standard departure',
+        re.IGNORECASE,
+    )),
+    ('star', re.compile(
+        r'star|стар|прилёт|прилет|arrival|стандартного прибытия|standard arrival',
+        re.IGNORECASE,
+    )),
+    ('approach', re.compile(
+        r'approach|захода на посадку|заход|iac|ils|vor|ndb|rnav|rnp|gls|instrument approach'
+        r'|visual approach|визуального захода|precision approach',
+        re.IGNORECASE,
+    )),
+    ('airport_diagram', re.compile(
+        r'карта аэродрома|аэродромного наземного движения|ground|parking|стоянк'
+        r'|стыковки воздушных судов|движение|aerodrome chart|ground movement'
+        r'|aircraft parking|docking|safedock|stands',
+        re.IGNORECASE,
+    )),
+)
 
 
 class RussiaScraper:
@@ -44,8 +86,40 @@ class RussiaScraper:
                 print(f"Error fetching data for {icao_code}: {e}")
             return []
     
+    def get_charts_many(self, icao_codes: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Fetch aerodrome charts for several Russian airports.
+        
+        The menu lists the charts of every airport, so it is fetched and
+        parsed once for the whole batch.
+        
+        Args:
+            icao_codes: ICAO codes of the airports
+            
+        Returns:
+            Dictionary mapping each upper-cased ICAO code to its chart list
+        """
+        icao_codes = [code.upper() for code in icao_codes]
+        
+        try:
+            airports = self._fetch_airports()
+        except Exception as e:
+            if self.verbose:
+                print(f"Error fetching CAIGA menu: {e}")
+            airports = {}
+        
+        return {code: self._charts_for_airport(airports, code) for code in icao_codes}
+    
+    async def get_charts_many_async(self, icao_codes: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """Async wrapper around get_charts_many for use from an event loop."""
+        return await asyncio.to_thread(self.get_charts_many, icao_codes)
+    
     def _get_charts_from_web(self, icao_code: str) -> List[Dict[str, str]]:
         """Fetch charts from the CAIGA website."""
+        return self._charts_for_airport(self._fetch_airports(), icao_code)
+    
+    def _fetch_airports(self) -> Dict[str, Dict]:
+        """Fetch and parse the CAIGA menu into airport data."""
         if self.verbose:
             print(f"Fetching CAIGA menu...")
         
@@ -57,19 +131,20 @@ class RussiaScraper:
         response.raise_for_status()
         
         # Parse the menu HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
+        encoding = declared_encoding(response)
+        parser = lxml_html.HTMLParser(encoding=encoding) if encoding else None
+        tree = lxml_html.fromstring(response.content, parser=parser)
         
         # Find the script tag containing the menu
-        script_content = None
-        for script in soup.find_all('script'):
-            if script.string and 'ItemBegin' in script.string:
-                script_content = script.string
-                break
+        script_content = next(
+            (script.text for script in tree.iter('script') if script.text and 'ItemBegin' in script.text),
+            None,
+        )
         
         if not script_content:
             if self.verbose:
                 print("Could not find menu script")
-            return []
+            return {}
         
         # Parse the script content
         airports = self._parse_menu(script_content)
@@ -77,6 +152,10 @@ class RussiaScraper:
         if self.verbose:
             print(f"Parsed {len(airports)} airports")
         
+        return airports
+    
+    def _charts_for_airport(self, airports: Dict[str, Dict], icao_code: str) -> List[Dict[str, str]]:
+        """Convert one airport's menu entries to chart dictionaries."""
         # Find the requested airport
         if icao_code not in airports:
             if self.verbose:
@@ -121,30 +200,34 @@ class RussiaScraper:
         current_name = None
         current_charts = {}
         
-        for line in script_content.split('\n'):
-            line = line.strip()
-            
-            # Check for AD 2. Аэродромы / AD 2. Aerodromes section
-            if 'ItemBegin' in line and 'AD 2' in line and ('Аэродром' in line or 'Aerodrome' in line):
-                in_ad2_section = True
-                if self.verbose:
-                    print("Found AD 2 Aerodromes section")
-                continue
+        for token in _MENU_TOKEN_RE.finditer(script_content):
+            kind = token.group(1)
+            call = token.group(0)
             
-            # Stop at AD 3 or AD 4
-            if in_ad2_section and 'ItemBegin' in line and ('AD 3' in line or 'AD 4' in line):
-                in_ad2_section = False
-                if self.verbose:
-                    print("Left AD 2 section")
-                continue
+            if kind == 'Begin':
+                args = token.group(2)
+                
+                # Check for AD 2. Аэродромы / AD 2. Aerodromes section
+                if 'AD 2' in args and ('Аэродром' in args or 'Aerodrome' in args):
+                    in_ad2_section = True
+                    if self.verbose:
+                        print("Found AD 2 Aerodromes section")
+                    continue
+                
+                # Stop at AD 3 or AD 4
+                if in_ad2_section and ('AD 3' in args or 'AD 4' in args):
+                    in_ad2_section = False
+                    if self.verbose:
+                        print("Left AD 2 section")
+                    continue
             
             if not in_ad2_section:
                 continue
             
             # Parse ItemBegin for airport
-            if 'ItemBegin' in line:
+            if kind == 'Begin':
                 # Extract: ItemBegin("5159", "","UUEE. МОСКВА (ШЕРЕМЕТЬЕВО)");
-                match = re.search(r'ItemBegin\("(\d+)",\s*"[^"]*",\s*"([^"]+)"\);', line)
+                match = _ITEM_BEGIN_RE.match(call)
                 if match:
                     title = match.group(2)
                     # Check if this is an airport entry (format: "XXXX. NAME")
@@ -153,12 +236,11 @@ class RussiaScraper:
                         current_name = title[6:].strip()
                         current_charts = {}
                         # Don't print Cyrillic characters that may cause encoding issues
-                continue
             
             # Parse ItemLink
-            if 'ItemLink' in line and current_code:
+            elif kind == 'Link' and current_code:
                 # Extract: ItemLink("../aip/ad/ad2/uuee/1-ad2-rus-uuee-txt.pdf","DATA, TEXTS, TABLES");
-                match = re.search(r'ItemLink\("([^"]+)",\s*"([^"]+)"\);', line)
+                match = _ITEM_LINK_RE.match(call)
                 if match:
                     href = match.group(1)
                     title = match.group(2)
@@ -166,14 +248,13 @@ class RussiaScraper:
                     # Include DATA, TEXTS, TABLES entries
                     
                     # Clean up title - remove number prefix like "(31)"
-                    title = re.sub(r'^\(\d+\)\s*', '', title)
+                    title = _NUM_PREFIX_RE.sub('', title)
                     
                     filename = f"{current_code} - {title.replace('.', '')}.pdf"
                     current_charts[title] = (href, filename)
-                continue
             
             # Parse ItemEnd
-            if 'ItemEnd' in line and current_code:
+            elif kind == 'End' and current_code:
                 # Save the airport data
                 airports[current_code] = {
                     'name': current_name,
@@ -182,7 +263,6 @@ class RussiaScraper:
                 current_code = None
                 current_name = None
                 current_charts = {}
-                continue
         
         return airports
     
@@ -197,43 +277,7 @@ class RussiaScraper:
         Returns:
             Chart type: 'general', 'airport_diagram', 'sid', 'star', or 'approach'
         """
-        name_lower = name.lower()
-        url_lower = url.lower()
-        combined = f"{name_lower} {url_lower}"
-        
-        # Keywords for chart types (Russian and English)
-        # SID (Standard Instrument Departure)
-        if any(keyword in combined for keyword in [
-            'sid', 'сид', 'вылет', 'departure', 'стандартного вылета',
-            'standard departure'
-        ]):
-            return 'sid'
-        
-        # STAR (Standard Terminal Arrival Route)
-        if any(keyword in combined for keyword in [
-            'star', 'стар', 'прилёт', 'прилет', 'arrival', 'стандартного прибытия',
-            'standard arrival'
-        ]):
-            return 'star'
-        
-        # Approach charts
-        if any(keyword in combined for keyword in [
-            'approach', 'захода на посадку', 'заход', 'iac', 'ils', 'vor', 'ndb', 
-            'rnav', 'rnp', 'gls', 'instrument approach', 'visual approach',
-            'визуального захода', 'precision approach'
-        ]):
-            return 'approach'
-        
-        # Airport/Ground charts
-        if any(keyword in combined for keyword in [
-            'карта аэродрома', 'аэродромного наземного движения', 'ground', 'parking', 
-            'стоянк', 'стыковки воздушных судов', 'движение', 'aerodrome chart',
-            'ground movement', 'aircraft parking', 'docking', 'safedock', 'stands'
-        ]):
-            return 'airport_diagram'
-        
-        # Default to general
-        return 'general'
+        return categorize_by_patterns(f"{name} {url}", _CATEGORY_PATTERNS, 'general')
 
 
 if __name__ == '__main__':
@@ -7,11 +7,21 @@ https://aimss.sans.com.sa/assets/FileManagerFiles/History-en-SA.html
 Eurocontrol-style eAIP with AD 2.24 charts section.
 """
 
+import asyncio
+import os
 import re
 import sys
+import time
 import requests
+from functools import lru_cache, partial
 from urllib.parse import urljoin, quote
 
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, map_threaded, response_text, scan_chart_links
+
 # Disable SSL warnings
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,43 +30,106 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 HISTORY_PAGE = "https://aimss.sans.com.sa/assets/FileManagerFiles/History-en-SA.html"
 FILES_BASE = "https://aimss.sans.com.sa/assets/FileManagerFiles"
 
+# AIRAC folder links on the history page
+_AIRAC_FOLDER_RE = re.compile(r'href="([^"]*AIRAC[^"]*)/index\.html"')
+# PDF links on an airport page (matched on the raw streamed bytes)
+_PDF_HREF_RE = re.compile(rb'href="([^"]*\.pdf)"', re.IGNORECASE)
+# Obstacle data PDFs (not charts)
+_OBSTACLE_DATA_RE = re.compile(r'eTOD|Obstacle')
+
+# Chart type keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|STANDARD DEPARTURE|DEPARTURE CHART', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|STANDARD ARRIVAL|ARRIVAL CHART', re.IGNORECASE)),
+    ('APP', re.compile(r'APPROACH|IAC|ILS|RNP|VOR|NDB|VISUAL', re.IGNORECASE)),
+    ('GND', re.compile(r'GROUND|TAXI|PARKING|DOCKING|APRON|ADC|AERODROME CHART', re.IGNORECASE)),
+)
+
+
+# The history page is re-read at most once per hour; the menu is keyed by AIRAC folder
+_CACHE_TTL = 3600
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_airac_folder(ttl_bucket):
+    """Fetch the currently effective AIRAC folder (cached per TTL bucket)."""
+    response = SESSION.get(HISTORY_PAGE, verify=False, timeout=30)
+    response.raise_for_status()
+    
+    # Find AIRAC folder links; the first one is currently effective
+    airac_folders = _AIRAC_FOLDER_RE.findall(response_text(response))
+    if not airac_folders:
+        # Raised rather than returned so a miss is not cached
+        raise LookupError("No AIRAC folders found")
+    return airac_folders[0]
+
 
 def get_latest_airac_folder(verbose=False):
     """Get the latest AIRAC folder name from the history page."""
     try:
-        response = requests.get(HISTORY_PAGE, verify=False, timeout=30)
-        response.raise_for_status()
-        
-        # Find AIRAC folder links
-        airac_folders = re.findall(r'href="([^"]*AIRAC[^"]*)/index\.html"', response.text)
-        
-        if airac_folders:
-            # Get the first one (currently effective)
-            latest = airac_folders[0]
-            if verbose:
-                print(f"Found latest AIRAC folder: {latest}")
-            return latest
-        else:
-            if verbose:
-                print("No AIRAC folders found")
-            return None
-            
+        latest = _fetch_latest_airac_folder(int(time.time() // _CACHE_TTL))
+        if verbose:
+            print(f"Found latest AIRAC folder: {latest}")
+        return latest
+    except LookupError as e:
+        if verbose:
+            print(e)
+        return None
     except Exception as e:
         if verbose:
             print(f"Error getting AIRAC folder: {e}")
         return None
 
 
+def _eaip_base(airac_folder):
+    """eAIP base URL for an AIRAC folder (with encoded spaces in folder name)."""
+    return f"{FILES_BASE}/{quote(airac_folder)}/eAIP"
+
+
+@lru_cache(maxsize=1)
+def _get_menu_content(airac_folder):
+    """Fetch the eAIP menu for an AIRAC folder (cached until the folder changes)."""
+    response = SESSION.get(f"{_eaip_base(airac_folder)}/menu.html", verify=False, timeout=30)
+    response.raise_for_status()
+    return response_text(response)
+
+
+@lru_cache(maxsize=256)
+def _airport_page_pattern(icao_code):
+    """Compiled menu pattern for an airport's page filename."""
+    # Pattern: AD 2 OEJN JEDDAH - KING ABDULAZIZ INTERNATIONAL-en-GB.html
+    return re.compile(rf'(AD 2 {re.escape(icao_code)} [^"\'<>]+-en-GB\.html)')
+
+
 def get_airport_page_name(menu_content, icao_code):
     """Extract the full airport page filename from the menu content."""
-    # Pattern: AD 2 OEJN JEDDAH - KING ABDULAZIZ INTERNATIONAL-en-GB.html
-    pattern = rf'(AD 2 {icao_code} [^"\'<>]+-en-GB\.html)'
-    match = re.search(pattern, menu_content)
+    match = _airport_page_pattern(icao_code).search(menu_content)
     if match:
         return match.group(1)
     return None
 
 
+def _is_chart_href(pdf_href):
+    """Whether a PDF link is a chart rather than obstacle data (eTOD)."""
+    return _OBSTACLE_DATA_RE.search(pdf_href) is None
+
+
+def _chart_from_href(pdf_href, airport_url):
+    """Build the chart entry for one PDF link on an airport page."""
+    # Resolve relative URL and URL-encode spaces in the path
+    # (the URLs have spaces in folder and file names)
+    pdf_url = urljoin(airport_url, pdf_href).replace(' ', '%20')
+    
+    # Extract chart name from filename
+    chart_name = pdf_href[pdf_href.rfind('/') + 1:].replace('.pdf', '')
+    
+    return {
+        'name': chart_name,
+        'url': pdf_url,
+        'type': categorize_chart(chart_name)
+    }
+
+
 def get_aerodrome_charts(icao_code, verbose=False):
     """
     Get aerodrome charts for a given ICAO code from Saudi Arabia eAIP.
@@ -79,19 +152,15 @@ def get_aerodrome_charts(icao_code, verbose=False):
                 print("Could not determine AIRAC folder")
             return []
         
-        # Construct base URL (with encoded spaces in folder name)
-        eaip_base = f"{FILES_BASE}/{quote(airac_folder)}/eAIP"
+        eaip_base = _eaip_base(airac_folder)
         
         # Fetch the menu to find airport page filename
-        menu_url = f"{eaip_base}/menu.html"
         if verbose:
-            print(f"Fetching menu: {menu_url}")
-        
-        response = requests.get(menu_url, verify=False, timeout=30)
-        response.raise_for_status()
+            print(f"Fetching menu: {eaip_base}/menu.html")
+        menu_content = _get_menu_content(airac_folder)
         
         # Find airport page name
-        airport_page_name = get_airport_page_name(response.text, icao_code)
+        airport_page_name = get_airport_page_name(menu_content, icao_code)
         if not airport_page_name:
             if verbose:
                 print(f"Airport {icao_code} not found in Saudi eAIP menu")
@@ -105,57 +174,34 @@ def get_aerodrome_charts(icao_code, verbose=False):
         if verbose:
             print(f"Fetching airport page: {airport_url}")
         
-        response = requests.get(airport_url, verify=False, timeout=60)
-        
-        if response.status_code == 404:
-            if verbose:
-                print(f"Airport page not found for {icao_code}")
-            return []
-        
-        response.raise_for_status()
-        html_content = response.text
+        # Stream the page so only a window of it is held in memory
+        with SESSION.get(airport_url, verify=False, timeout=60, stream=True) as response:
+            if response.status_code == 404:
+                if verbose:
+                    print(f"Airport page not found for {icao_code}")
+                return []
+            
+            response.raise_for_status()
+            
+            # Find all PDF links
+            pdf_links, bytes_read = scan_chart_links(response, _PDF_HREF_RE, _is_chart_href)
         
         if verbose:
-            print(f"Airport page fetched ({len(html_content)} bytes)")
-        
-        # Find all PDF links
-        pdf_pattern = re.compile(r'href="([^"]*\.pdf)"', re.IGNORECASE)
-        pdf_links = pdf_pattern.findall(html_content)
+            print(f"Airport page fetched ({bytes_read} bytes)")
         
         if verbose:
             print(f"Found {len(pdf_links)} PDF links")
         
-        # Process each PDF link
-        seen_urls = set()
-        for pdf_href in pdf_links:
-            # Skip obstacle data PDFs (not charts)
-            if 'eTOD' in pdf_href or 'Obstacle' in pdf_href:
-                continue
-            
-            # Resolve relative URL
-            pdf_url = urljoin(airport_url, pdf_href)
-            
-            # URL-encode spaces in the path
-            # The URLs have spaces in folder and file names
-            pdf_url = pdf_url.replace(' ', '%20')
-            
-            # Skip duplicates
-            if pdf_url in seen_urls:
-                continue
-            seen_urls.add(pdf_url)
-            
-            # Extract chart name from filename
-            filename = pdf_href.split('/')[-1]
-            chart_name = filename.replace('.pdf', '')
-            
-            # Categorize the chart
-            chart_type = categorize_chart(chart_name)
-            
-            charts.append({
-                'name': chart_name,
-                'url': pdf_url,
-                'type': chart_type
-            })
+        # Drop obstacle data PDFs and repeated hrefs before building URLs
+        unique_hrefs = dict.fromkeys(h for h in pdf_links if _is_chart_href(h))
+        
+        # Build a chart entry per chart PDF, keeping the first one per URL
+        # (different hrefs can still resolve to the same URL)
+        charts_by_url = {}
+        for pdf_href in unique_hrefs:
+            chart = _chart_from_href(pdf_href, airport_url)
+            charts_by_url.setdefault(chart['url'], chart)
+        charts = list(charts_by_url.values())
         
         if verbose:
             print(f"Processed {len(charts)} unique charts")
@@ -174,32 +220,47 @@ def get_aerodrome_charts(icao_code, verbose=False):
         return []
 
 
-def categorize_chart(chart_name):
-    """Categorize chart based on chart name."""
-    name_upper = chart_name.upper()
-    
-    # SID charts
-    if 'SID' in name_upper or 'STANDARD DEPARTURE' in name_upper or 'DEPARTURE CHART' in name_upper:
-        return 'SID'
-    
-    # STAR charts
-    elif 'STAR' in name_upper or 'STANDARD ARRIVAL' in name_upper or 'ARRIVAL CHART' in name_upper:
-        return 'STAR'
+def get_aerodrome_charts_many(icao_codes, verbose=False, max_workers=8):
+    """
+    Get aerodrome charts for several ICAO codes at once.
     
-    # Approach charts
-    elif any(x in name_upper for x in ['APPROACH', 'IAC', 'ILS', 'RNP', 'VOR', 'NDB', 'VISUAL']):
-        return 'APP'
+    The AIRAC folder and menu are resolved once up front, then the airport
+    pages are fetched concurrently over the shared session's pooled connections.
     
-    # Ground charts
-    elif any(x in name_upper for x in ['GROUND', 'TAXI', 'PARKING', 'DOCKING', 'APRON', 'ADC', 'AERODROME CHART']):
-        return 'GND'
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        verbose: Print debug information
+        max_workers: Number of airport pages fetched in parallel
+        
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
     
-    # Area/general
-    elif 'AREA CHART' in name_upper or 'TERRAIN' in name_upper or 'OBSTACLE' in name_upper:
-        return 'GEN'
+    # Warm the folder/menu caches so the workers don't all race to fetch them
+    airac_folder = get_latest_airac_folder(verbose)
+    if not airac_folder:
+        return {code: [] for code in icao_codes}
+    try:
+        _get_menu_content(airac_folder)
+    except requests.RequestException as e:
+        if verbose:
+            print(f"Error fetching eAIP menu: {e}")
+        return {code: [] for code in icao_codes}
     
-    else:
-        return 'GEN'
+    results = map_threaded(partial(get_aerodrome_charts, verbose=verbose), icao_codes, max_workers)
+    return dict(zip(icao_codes, results))
+
+
+async def get_aerodrome_charts_many_async(icao_codes, verbose=False):
+    """Async wrapper around get_aerodrome_charts_many for use from an event loop."""
+    return await asyncio.to_thread(get_aerodrome_charts_many, icao_codes, verbose)
+
+
+def categorize_chart(chart_name):
+    """Categorize chart based on chart name."""
+    # Area, terrain and obstacle charts fall through to GEN
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'GEN')
 
 
 if __name__ == "__main__":
@@ -14,11 +14,57 @@ Structure:
 - Charts in AD 2.24 section
 """
 
+import asyncio
+import codecs
+import os
 import re
-import urllib.request
-from urllib.parse import urljoin, quote
+import sys
+import time
+from functools import lru_cache
+from urllib.parse import urljoin
 from html.parser import HTMLParser
 
+import requests
+from lxml import html as lxml_html
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, airac_cached, categorize_by_patterns, gather_threaded, map_threaded, quote_href
+
+
+# The start page is re-read at most once per hour
+_CACHE_TTL = 3600
+
+# Date folder in start page links, e.g. "./27-Nov-2025-A/2025-11-27-AIRAC/html/index_commands.html"
+_DATE_FOLDER_RE = re.compile(r'\./([^/]+/[^/]+AIRAC)')
+# Trailing " – ICAO" / " - ICAO" on chart names
+_ICAO_SUFFIX_RE = re.compile(r'\s*[–-]\s*ICAO\s*$')
+_WS_RE = re.compile(r'\s+')
+# Chart type words and runway references in rowspan name cells
+_CHART_WORD_RE = re.compile(r'Chart|Departure|Arrival|Approach|Parking|Obstacle|Terrain')
+_RWY_RE = re.compile(r'RWY', re.IGNORECASE)
+# AD 2.24 heading text
+_AD224_HEADING_RE = re.compile(r'AD 2\.24', re.IGNORECASE)
+# Text-only AD 2.24 cell that looks like a chart name
+_CHART_NAME_RE = re.compile(r'Chart|Departure|Arrival|Approach|Parking|Obstacle|Terrain', re.IGNORECASE)
+# Marker div id that ends the AD 2.24 section on some pages
+_SECTION_END_ID = '2015072409482302'
+# Pages are read and parsed in chunks of this many bytes
+_STREAM_CHUNK_SIZE = 65536
+
+# Chart type keywords, checked in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'DEPARTURE|SID', re.IGNORECASE)),
+    ('STAR', re.compile(r'ARRIVAL|STAR', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|VOR|RNP|RNAV|LOC|NDB|DME', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(
+        r'AERODROME CHART|AIRPORT CHART|PARKING|DOCKING|GROUND MOVEMENT',
+        re.IGNORECASE,
+    )),
+)
+
 
 class DateFolderParser(HTMLParser):
     """Parser to extract the latest AIRAC date folder from start page."""
@@ -29,87 +75,45 @@ class DateFolderParser(HTMLParser):
         
     def handle_starttag(self, tag, attrs):
         if tag == 'a':
-            attrs_dict = dict(attrs)
-            href = attrs_dict.get('href', '')
+            # attrs is a short list of (name, value) pairs; scan it instead of building a dict
+            href = next((value for name, value in attrs if name == 'href'), None) or ''
             # Look for date folder pattern like "./27-Nov-2025-A/2025-11-27-AIRAC/html/index_commands.html"
             if 'AIRAC' in href and 'html/index_commands.html' in href:
                 # Extract the date folder part: "27-Nov-2025-A/2025-11-27-AIRAC"
-                match = re.search(r'\./([^/]+/[^/]+AIRAC)', href)
+                match = _DATE_FOLDER_RE.search(href)
                 if match:
                     self.date_folder = match.group(1)
 
 
-class ChartLinksParser(HTMLParser):
-    """Parser to extract chart links and names from AD 2.24 section."""
-    
-    def __init__(self):
-        super().__init__()
-        self.charts = []
-        self.in_ad_224 = False
-        self.current_chart_name = None
-        self.in_chart_name_td = False
-        
-    def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
-        
-        # Check if we're entering AD 2.24 section
-        if tag == 'h4':
-            self.current_chart_name = None
-        elif tag == 'td':
-            # Chart name cells have specific pattern
-            rowspan = attrs_dict.get('rowspan', '')
-            valign = attrs_dict.get('valign', '')
-            if rowspan and valign == 'top':
-                self.in_chart_name_td = True
-                self.current_chart_name = None
-        elif tag == 'a' and 'href' in attrs_dict:
-            href = attrs_dict['href']
-            # Look for PDF links in graphics/eAIP/ folder
-            if '.pdf' in href.lower() and 'graphics/eAIP/' in href:
-                if self.current_chart_name:
-                    # Clean up the chart name (remove ICAO prefix like "ICAO")
-                    chart_name = self.current_chart_name.strip()
-                    chart_name = re.sub(r'\s*–\s*ICAO\s*$', '', chart_name)
-                    chart_name = re.sub(r'\s*-\s*ICAO\s*$', '', chart_name)
-                    
-                    self.charts.append({
-                        'name': chart_name,
-                        'url': href
-                    })
-                    
-    def handle_data(self, data):
-        if self.in_chart_name_td:
-            text = data.strip()
-            if text and not text.startswith('AD ') and 'RWY' in text.upper() or any(x in text for x in ['Chart', 'Departure', 'Arrival', 'Approach', 'Parking', 'Obstacle', 'Terrain']):
-                # This looks like a chart type name
-                self.current_chart_name = text
-                
-    def handle_endtag(self, tag):
-        if tag == 'td':
-            self.in_chart_name_td = False
-        elif tag == 'h4':
-            # Check if this is AD 2.24 section
-            if hasattr(self, 'current_section_title'):
-                if 'AD 2.24' in self.current_section_title or 'Charts related' in self.current_section_title:
-                    self.in_ad_224 = True
-
-
-def get_latest_date_folder():
+def _feed_streamed(parser, response):
     """
-    Fetch the latest AIRAC date folder from the start page.
+    Feed a streamed response body into an HTMLParser chunk by chunk.
     
-    Returns:
-        str: Date folder path like "27-Nov-2025-A/2025-11-27-AIRAC"
+    The page is never held as one decoded str; an incremental decoder keeps
+    UTF-8 sequences split across chunk boundaries intact.
+    
+    Args:
+        parser (HTMLParser): Parser to feed; it is closed at the end of the body
+        response: requests response fetched with stream=True
     """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    for chunk in response.iter_content(_STREAM_CHUNK_SIZE):
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_date_folder(ttl_bucket):
+    """Fetch the latest AIRAC date folder (cached per TTL bucket; failures raise and are not cached)."""
     base_url = 'https://smatsa.rs/upload/aip/published/'
     start_url = urljoin(base_url, 'start_page.html')
     
     try:
-        with urllib.request.urlopen(start_url) as response:
-            html = response.read().decode('utf-8', errors='ignore')
-            
         parser = DateFolderParser()
-        parser.feed(html)
+        with SESSION.get(start_url, timeout=(5, 30), stream=True) as response:
+            response.raise_for_status()
+            _feed_streamed(parser, response)
         
         if parser.date_folder:
             return parser.date_folder
@@ -120,18 +124,107 @@ def get_latest_date_folder():
         raise Exception(f"Failed to fetch latest date folder: {e}")
 
 
-def get_airport_page_url(icao_code):
+def _name_cell_text(cell):
+    """Last text run of a rowspan name cell that looks like a chart name, if any."""
+    chart_name = None
+    for data in cell.itertext():
+        # Every marker is at least 3 characters, so short runs (mostly
+        # whitespace between tags) are skipped before any stripping or searching
+        if len(data) < 3:
+            continue
+        text = data.strip()
+        # Chart words make any run a name; RWY only outside "AD ..." page references
+        if _CHART_WORD_RE.search(text) or not text.startswith('AD ') and _RWY_RE.search(text):
+            chart_name = text
+    return chart_name
+
+
+def _parse_chart_links(tree):
+    """
+    Extract chart names and PDF links from a parsed airport page in one walk.
+    
+    Two layouts are handled by the same pass over the tree:
+    - rowspan/valign="top" name cells followed by graphics/eAIP/ PDF links
+      (used whenever the page has any)
+    - otherwise, text-only name cells in the AD 2.24 section, each paired
+      with the next PDF link
+    
+    Args:
+        tree: lxml root of the airport page
+        
+    Returns:
+        list: Chart dicts with 'name' and relative 'url'
+    """
+    named_charts = []
+    section_charts = []
+    current_name = None
+    in_section = False
+    section_done = False
+    pending_name = None
+    for element in tree.iter('h4', 'div', 'td', 'a'):
+        tag = element.tag
+        if tag == 'h4':
+            current_name = None
+            if in_section:
+                in_section, section_done = False, True
+            elif not section_done:
+                in_section = _AD224_HEADING_RE.search(element.text_content()) is not None
+        elif tag == 'div':
+            element_id = element.get('id', '')
+            if in_section and element_id.startswith('AD2') and _SECTION_END_ID in element_id:
+                in_section, section_done = False, True
+        elif tag == 'td':
+            if element.get('rowspan') and element.get('valign') == 'top':
+                current_name = _name_cell_text(element)
+            # Only text-only cells name a chart; the first name waits for the next PDF link
+            if in_section and pending_name is None and len(element) == 0 and element.text \
+                    and _CHART_NAME_RE.search(element.text):
+                pending_name = element.text
+        else:
+            href = element.get('href')
+            if href is None:
+                continue
+            href_lower = href.lower()
+            if current_name and '.pdf' in href_lower and 'graphics/eAIP/' in href:
+                named_charts.append({
+                    'name': _ICAO_SUFFIX_RE.sub('', current_name.strip()),
+                    'url': href
+                })
+            if in_section and pending_name is not None and href_lower.endswith('.pdf'):
+                # Clean up name
+                name = _WS_RE.sub(' ', pending_name.strip())
+                name = _ICAO_SUFFIX_RE.sub('', name)
+                if name:
+                    section_charts.append({'name': name, 'url': href})
+                pending_name = None
+    
+    return named_charts or section_charts
+
+
+def get_latest_date_folder():
+    """
+    Fetch the latest AIRAC date folder from the start page.
+    
+    Returns:
+        str: Date folder path like "27-Nov-2025-A/2025-11-27-AIRAC"
+    """
+    return _fetch_latest_date_folder(int(time.time() // _CACHE_TTL))
+
+
+def get_airport_page_url(icao_code, date_folder=None):
     """
     Construct the URL for an airport's eAIP page.
     
     Args:
         icao_code (str): 4-letter ICAO code (e.g., 'LYBE')
+        date_folder (str): AIRAC date folder; resolved from the start page if omitted
         
     Returns:
         str: Full URL to airport page
     """
     base_url = 'https://smatsa.rs/upload/aip/published/'
-    date_folder = get_latest_date_folder()
+    if date_folder is None:
+        date_folder = get_latest_date_folder()
     
     # Airport pages are in eAIP subfolder with format LY-AD-2.{ICAO}-en-GB.html
     airport_page = f"html/eAIP/LY-AD-2.{icao_code}-en-GB.html"
@@ -149,26 +242,8 @@ def categorize_chart(chart_name):
     Returns:
         str: Chart category (SID/STAR/Approach/Airport Diagram/General)
     """
-    name_upper = chart_name.upper()
-    
-    # SID charts
-    if any(keyword in name_upper for keyword in ['DEPARTURE', 'SID']):
-        return 'SID'
-    
-    # STAR charts
-    if any(keyword in name_upper for keyword in ['ARRIVAL', 'STAR']):
-        return 'STAR'
-    
-    # Approach charts
-    if any(keyword in name_upper for keyword in ['APPROACH', 'ILS', 'VOR', 'RNP', 'RNAV', 'LOC', 'NDB', 'DME']):
-        return 'Approach'
-    
-    # Airport diagrams
-    if any(keyword in name_upper for keyword in ['AERODROME CHART', 'AIRPORT CHART', 'PARKING', 'DOCKING', 'GROUND MOVEMENT']):
-        return 'Airport Diagram'
-    
-    # Everything else is general
-    return 'General'
+    # Categories are checked in priority order; everything else is general
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code):
@@ -181,67 +256,45 @@ def get_aerodrome_charts(icao_code):
     Returns:
         list: List of dictionaries with 'name', 'url', and 'type' keys
     """
-    # Get the airport page URL
-    airport_url = get_airport_page_url(icao_code)
+    # Airport pages don't change within an AIRAC cycle, so they are cached per date folder
+    return _fetch_airport_charts(icao_code, get_latest_date_folder())
+
+
+@airac_cached('serbia')
+def _fetch_airport_charts(icao_code, date_folder):
+    """Fetch and parse one airport page of the given AIRAC date folder."""
+    airport_url = get_airport_page_url(icao_code, date_folder)
     base_url = 'https://smatsa.rs/upload/aip/published/'
     
     try:
-        # Fetch the airport page
-        with urllib.request.urlopen(airport_url) as response:
-            html = response.read().decode('utf-8', errors='ignore')
-        
-        # Parse for chart links
-        parser = ChartLinksParser()
-        parser.feed(html)
+        # Fetch the airport page, parsing it as it arrives. Served as UTF-8,
+        # sometimes with an XML declaration; a parser per call, as lxml
+        # parsers must not be fed from several threads at once.
+        feed_parser = lxml_html.HTMLParser(encoding='utf-8')
+        with SESSION.get(airport_url, timeout=(5, 30), stream=True) as response:
+            if response.status_code == 404:
+                print(f"Airport {icao_code} not found in Serbia/Montenegro eAIP")
+                return []
+            response.raise_for_status()
+            for chunk in response.iter_content(_STREAM_CHUNK_SIZE):
+                feed_parser.feed(chunk)
         
-        if not parser.charts:
-            # Try alternative parsing - look for AD 2.24 section directly with regex
-            # Find the AD 2.24 section
-            ad_224_match = re.search(r'<h4[^>]*>.*?AD 2\.24.*?</h4>(.*?)(?=<h4[^>]*>|<div[^>]*id="AD2[^"]*2015072409482302)', html, re.DOTALL | re.IGNORECASE)
-            
-            if ad_224_match:
-                ad_224_section = ad_224_match.group(1)
-                
-                # Find all PDF links in this section with their descriptions
-                # Pattern: look for table rows with chart names and PDF links
-                chart_pattern = r'<td[^>]*>([^<]*(?:Chart|Departure|Arrival|Approach|Parking|Obstacle|Terrain)[^<]*)</td>.*?<a[^>]*href="([^"]*\.pdf)"'
-                
-                matches = re.finditer(chart_pattern, ad_224_section, re.DOTALL | re.IGNORECASE)
-                
-                charts_temp = []
-                for match in matches:
-                    name = match.group(1).strip()
-                    url = match.group(2)
-                    
-                    # Clean up name
-                    name = re.sub(r'\s+', ' ', name)
-                    name = re.sub(r'\s*–\s*ICAO\s*$', '', name)
-                    name = re.sub(r'\s*-\s*ICAO\s*$', '', name)
-                    
-                    if name and url:
-                        charts_temp.append({'name': name, 'url': url})
-                
-                if charts_temp:
-                    parser.charts = charts_temp
-        
-        if not parser.charts:
+        charts = _parse_chart_links(feed_parser.close())
+        if not charts:
             return []
         
         # Process charts - convert relative URLs to absolute and categorize
-        date_folder = get_latest_date_folder()
         result = []
         
-        for chart in parser.charts:
+        for chart in charts:
             # Convert relative URL to absolute
             # URLs are like "../../graphics/eAIP/6688438_LY_AD_2_LYBE_2-24-12-1_en.pdf"
             # Airport page is at: {base}/{date}/html/eAIP/LY-AD-2.{ICAO}-en-GB.html
             # Charts are at: {base}/{date}/graphics/eAIP/{filename}.pdf
             # So ../../graphics/eAIP/ goes up from eAIP/ to html/ to {date}/ then into graphics/eAIP/
             if chart['url'].startswith('../../graphics/eAIP/'):
-                # Extract just the filename and URL encode it (spaces, etc.)
-                filename = chart['url'].replace('../../graphics/eAIP/', '')
-                filename_encoded = quote(filename, safe='')
-                chart_url = urljoin(base_url, f"{date_folder}/graphics/eAIP/{filename_encoded}")
+                # URL encode the link (spaces, etc.) and resolve it against the airport page
+                chart_url = urljoin(airport_url, quote_href(chart['url']))
             elif chart['url'].startswith('../'):
                 chart_url = urljoin(base_url, f"{date_folder}/" + chart['url'].replace('../', '', 1))
             else:
@@ -255,16 +308,59 @@ def get_aerodrome_charts(icao_code):
         
         return result
         
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
-            print(f"Airport {icao_code} not found in Serbia/Montenegro eAIP")
-            return []
-        else:
-            raise Exception(f"HTTP error fetching charts for {icao_code}: {e}")
+    except requests.HTTPError as e:
+        raise Exception(f"HTTP error fetching charts for {icao_code}: {e}")
     except Exception as e:
         raise Exception(f"Error fetching charts for {icao_code}: {e}")
 
 
+def get_aerodrome_charts_many(icao_codes, max_workers=8):
+    """
+    Fetch aerodrome charts for several ICAO codes in parallel.
+    
+    Args:
+        icao_codes (iterable): 4-letter ICAO codes
+        max_workers (int): Number of airport pages fetched in parallel
+        
+    Returns:
+        dict: Upper-cased ICAO code -> list of chart dictionaries
+              (empty for airports that failed)
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    # Resolve the date folder once so the workers don't all race to fetch it
+    get_latest_date_folder()
+    
+    return dict(zip(icao_codes, map_threaded(_charts_or_empty, icao_codes, max_workers)))
+
+
+async def get_aerodrome_charts_many_async(icao_codes, limit=8):
+    """
+    Fetch aerodrome charts for several ICAO codes from async code.
+    
+    Args:
+        icao_codes (iterable): 4-letter ICAO codes
+        limit (int): Maximum number of airport pages fetched at once
+        
+    Returns:
+        dict: Upper-cased ICAO code -> list of chart dictionaries
+              (empty for airports that failed)
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    await asyncio.to_thread(get_latest_date_folder)
+    results = await gather_threaded(_charts_or_empty, icao_codes, limit)
+    return dict(zip(icao_codes, results))
+
+
+def _charts_or_empty(icao_code):
+    """get_aerodrome_charts for the batch lookups: a failed airport yields no charts."""
+    try:
+        return get_aerodrome_charts(icao_code)
+    except Exception as e:
+        print(e)
+        return []
+
+
 # For CLI compatibility
 if __name__ == '__main__':
     import sys
@@ -7,11 +7,21 @@ https://aim-sg.caas.gov.sg/aip/
 Eurocontrol-style eAIP with standard AD-2.24 charts section.
 """
 
+import asyncio
+import os
 import re
 import sys
+import time
 import requests
+from functools import lru_cache
 from urllib.parse import urljoin
 
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, airac_cached, categorize_by_patterns, gather_threaded, map_threaded, response_text
+
 # Disable SSL warnings
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,33 +30,52 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 BASE_URL = "https://aim-sg.caas.gov.sg"
 AIP_PAGE = f"{BASE_URL}/aip/"
 
+# The AIP page is re-read at most once per hour
+_CACHE_TTL = 3600
+
+# eAIP index links on the AIP page, e.g.
+# /aim-content/uploads/aip/05-FEB-2026/AIP-1/2026-01-22-000000/html/index-en-GB.html
+_EAIP_INDEX_RE = re.compile(r'href="([^"]*aim-content/uploads/aip[^"]+index-en-GB\.html[^"]*)"')
+# PDF links with query string, e.g. href="../../pdf/SG-AD-2-WSSS-*.pdf?s=...";
+# captures the href and its filename (the path part after the last slash)
+_PDF_QUERY_RE = re.compile(r'href="((?:[^"?]*/)?([^"/?]*\.pdf)\?[^"]*)"', re.IGNORECASE)
+
+# Chart type keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR', re.IGNORECASE)),
+    ('APP', re.compile(r'IAC|ILS|RNP|VOR|NDB|VISUAL|APCH', re.IGNORECASE)),
+    ('GND', re.compile(r'ADC|AOC|PATC|GMC|APDC|PARKING|TAXI', re.IGNORECASE)),
+)
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_eaip_base(ttl_bucket):
+    """Fetch the latest eAIP HTML base path (cached per TTL bucket)."""
+    response = SESSION.get(AIP_PAGE, verify=False, timeout=(5, 30))
+    response.raise_for_status()
+    
+    # Find eAIP index link
+    eaip_links = _EAIP_INDEX_RE.findall(response_text(response))
+    if not eaip_links:
+        # Raised rather than returned so a miss is not cached
+        raise LookupError("No eAIP links found on AIP page")
+    
+    # Get the first (latest) link and remove the filename to get the html folder path
+    return eaip_links[0].rsplit('/', 1)[0]
+
 
 def get_latest_eaip_base(verbose=False):
     """Get the latest eAIP HTML base URL from the AIP page."""
     try:
-        response = requests.get(AIP_PAGE, verify=False, timeout=30)
-        response.raise_for_status()
-        
-        # Find eAIP index link
-        # Pattern: /aim-content/uploads/aip/05-FEB-2026/AIP-1/2026-01-22-000000/html/index-en-GB.html
-        eaip_links = re.findall(
-            r'href="([^"]*aim-content/uploads/aip[^"]+index-en-GB\.html[^"]*)"', 
-            response.text
-        )
-        
-        if eaip_links:
-            # Get the first (latest) link and extract base path
-            eaip_path = eaip_links[0]
-            # Remove the filename to get the html folder path
-            html_base = eaip_path.rsplit('/', 1)[0]
-            if verbose:
-                print(f"Found latest eAIP base: {html_base}")
-            return html_base
-        else:
-            if verbose:
-                print("No eAIP links found on AIP page")
-            return None
-            
+        html_base = _fetch_latest_eaip_base(int(time.time() // _CACHE_TTL))
+        if verbose:
+            print(f"Found latest eAIP base: {html_base}")
+        return html_base
+    except LookupError as e:
+        if verbose:
+            print(e)
+        return None
     except Exception as e:
         if verbose:
             print(f"Error getting eAIP base: {e}")
@@ -75,69 +104,8 @@ def get_aerodrome_charts(icao_code, verbose=False):
                 print("Could not determine eAIP base URL")
             return []
         
-        # Construct the airport page URL
-        # Pattern: SG-AD-2-WSSS-en-GB.html
-        airport_page_url = f"{BASE_URL}{html_base}/eAIP/SG-AD-2-{icao_code}-en-GB.html"
-        
-        if verbose:
-            print(f"Fetching airport page: {airport_page_url}")
-        
-        response = requests.get(airport_page_url, verify=False, timeout=60)
-        
-        if response.status_code == 404:
-            if verbose:
-                print(f"Airport {icao_code} not found in Singapore eAIP")
-            return []
-        
-        response.raise_for_status()
-        html_content = response.text
-        
-        if verbose:
-            print(f"Airport page fetched ({len(html_content)} bytes)")
-        
-        # Find all PDF links with query string
-        # Pattern: href="../../pdf/SG-AD-2-WSSS-*.pdf?s=..."
-        pdf_pattern = re.compile(r'href="([^"]*\.pdf\?[^"]*)"', re.IGNORECASE)
-        pdf_links = pdf_pattern.findall(html_content)
-        
-        if verbose:
-            print(f"Found {len(pdf_links)} PDF links")
-        
-        # Process each PDF link
-        seen_filenames = set()
-        for pdf_href in pdf_links:
-            # Skip old versions
-            if '/old/' in pdf_href:
-                continue
-            
-            # Get the base filename (before query string)
-            filename = pdf_href.split('?')[0].split('/')[-1]
-            
-            # Skip duplicates
-            if filename in seen_filenames:
-                continue
-            seen_filenames.add(filename)
-            
-            # Skip the main AD-2 document (not a chart)
-            if filename == f'SG-AD-2-{icao_code}.pdf':
-                continue
-            
-            # Resolve full URL
-            pdf_url = urljoin(airport_page_url, pdf_href)
-            
-            # Extract chart name from filename
-            chart_name = filename.replace('.pdf', '')
-            # Remove redundant prefix like "SG-AD-2-WSSS-AD-2-WSSS-"
-            chart_name = re.sub(rf'^SG-AD-2-{icao_code}-AD-2-{icao_code}-', '', chart_name)
-            
-            # Categorize the chart
-            chart_type = categorize_chart(chart_name)
-            
-            charts.append({
-                'name': chart_name,
-                'url': pdf_url,
-                'type': chart_type
-            })
+        # Airport pages don't change within an AIRAC cycle, so they are cached per eAIP edition
+        charts = _fetch_airport_charts(icao_code, html_base, verbose)
         
         if verbose:
             print(f"Processed {len(charts)} unique charts")
@@ -156,28 +124,124 @@ def get_aerodrome_charts(icao_code, verbose=False):
         return []
 
 
-def categorize_chart(chart_name):
-    """Categorize chart based on chart name."""
-    name_upper = chart_name.upper()
+@airac_cached('singapore')
+def _fetch_airport_charts(icao_code, html_base, verbose=False):
+    """Fetch and parse one airport page of the eAIP edition at html_base."""
+    charts = []
     
-    # SID charts
-    if 'SID' in name_upper:
-        return 'SID'
+    # Construct the airport page URL
+    # Pattern: SG-AD-2-WSSS-en-GB.html
+    airport_page_url = f"{BASE_URL}{html_base}/eAIP/SG-AD-2-{icao_code}-en-GB.html"
     
-    # STAR charts
-    elif 'STAR' in name_upper:
-        return 'STAR'
+    if verbose:
+        print(f"Fetching airport page: {airport_page_url}")
     
-    # Approach charts
-    elif any(x in name_upper for x in ['IAC', 'ILS', 'RNP', 'VOR', 'NDB', 'VISUAL', 'APCH']):
-        return 'APP'
+    response = SESSION.get(airport_page_url, verify=False, timeout=(5, 60))
     
-    # Ground/aerodrome charts
-    elif any(x in name_upper for x in ['ADC', 'AOC', 'PATC', 'GMC', 'APDC', 'PARKING', 'TAXI']):
-        return 'GND'
+    if response.status_code == 404:
+        if verbose:
+            print(f"Airport {icao_code} not found in Singapore eAIP")
+        return []
     
-    else:
-        return 'GEN'
+    response.raise_for_status()
+    html_content = response_text(response)
+    
+    if verbose:
+        print(f"Airport page fetched ({len(html_content)} bytes)")
+    
+    # Find all PDF links with query string
+    pdf_links = _PDF_QUERY_RE.findall(html_content)
+    
+    if verbose:
+        print(f"Found {len(pdf_links)} PDF links")
+    
+    # Redundant prefix on chart filenames, e.g. "SG-AD-2-WSSS-AD-2-WSSS-"
+    redundant_prefix = f'SG-AD-2-{icao_code}-AD-2-{icao_code}-'
+    
+    # Process each PDF link; the regex already split off the base filename
+    seen_filenames = set()
+    seen_add = seen_filenames.add
+    for pdf_href, filename in pdf_links:
+        # Skip old versions
+        if '/old/' in pdf_href:
+            continue
+        
+        # Skip duplicates
+        if filename in seen_filenames:
+            continue
+        seen_add(filename)
+        
+        # Skip the main AD-2 document (not a chart)
+        if filename == f'SG-AD-2-{icao_code}.pdf':
+            continue
+        
+        # Resolve full URL
+        pdf_url = urljoin(airport_page_url, pdf_href)
+        
+        # Extract chart name from filename
+        chart_name = filename.replace('.pdf', '')
+        # Remove redundant prefix
+        if chart_name.startswith(redundant_prefix):
+            chart_name = chart_name[len(redundant_prefix):]
+        
+        # Categorize the chart
+        chart_type = categorize_chart(chart_name)
+        
+        charts.append({
+            'name': chart_name,
+            'url': pdf_url,
+            'type': chart_type
+        })
+    
+    return charts
+
+
+def get_aerodrome_charts_many(icao_codes, verbose=False, max_workers=8):
+    """
+    Get aerodrome charts for several ICAO codes in parallel.
+    
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        verbose: Print debug information
+        max_workers: Number of airport pages fetched in parallel
+        
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    # Resolve the eAIP base once so the workers don't all race to fetch it
+    if not get_latest_eaip_base(verbose):
+        return {code: [] for code in icao_codes}
+    
+    results = map_threaded(lambda code: get_aerodrome_charts(code, verbose), icao_codes, max_workers)
+    return dict(zip(icao_codes, results))
+
+
+async def get_aerodrome_charts_many_async(icao_codes, verbose=False, limit=8):
+    """
+    Get aerodrome charts for several ICAO codes from async code.
+    
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        verbose: Print debug information
+        limit: Maximum number of airport pages fetched at once
+        
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    if not await asyncio.to_thread(get_latest_eaip_base, verbose):
+        return {code: [] for code in icao_codes}
+    
+    results = await gather_threaded(lambda code: get_aerodrome_charts(code, verbose), icao_codes, limit)
+    return dict(zip(icao_codes, results))
+
+
+def categorize_chart(chart_name):
+    """Categorize chart based on chart name."""
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'GEN')
 
 
 if __name__ == "__main__":
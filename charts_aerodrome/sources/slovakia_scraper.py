@@ -16,20 +16,87 @@ Structure:
 - Charts in AD 2.24 section with PDF links in graphics/ folder
 """
 
+import asyncio
+import os
 import re
 import requests
-from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
-from urllib.parse import urljoin, quote
+from lxml import html as lxml_html
+from urllib.parse import urljoin
 import sys
-import warnings
+import time
+from functools import lru_cache
 
-# Suppress XML parsing warnings (Slovakia AIP pages may be served as XML)
-warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, airac_cached, categorize_by_patterns, declared_encoding, gather_threaded, map_threaded, quote_href, stripped_text
 
 # Base URL for the AIP main page (session-based access may be required)
 MAIN_PAGE_URL = "https://aim.lps.sk/web/index.php?fn=200&lng=en"
 BASE_URL = "https://aim.lps.sk/web/"
 
+# The main page is re-read at most once per hour
+_CACHE_TTL = 3600
+
+# eAIP html base inside an AIP_SR_EFF link (fallback when no "Currently Effective" link)
+_EAIP_BASE_RE = re.compile(r'(https?://[^"\']+eAIP_SR/AIP_SR_EFF_[^/]+/html/)')
+_WS_RE = re.compile(r'\s+')
+# Trailing page references on chart names, e.g. "AD 2-LZIB-2-1"
+_PAGE_REF_RE = re.compile(r'\s*AD\s*2-[A-Z]{4}-\d+-\d+.*$')
+
+# Chart type keywords, checked in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'DEPARTURE|SID|DEP CHART', re.IGNORECASE)),
+    ('STAR', re.compile(r'ARRIVAL|STAR|ARR CHART', re.IGNORECASE)),
+    ('Approach', re.compile(
+        r'APPROACH|ILS|VOR|RNP|RNAV|LOC|NDB|DME|INSTRUMENT APPROACH|CIRCLING|PRECISION APPROACH',
+        re.IGNORECASE,
+    )),
+    ('Airport Diagram', re.compile(
+        r'AERODROME CHART|AIRPORT CHART|PARKING|DOCKING|GROUND MOVEMENT|TAXI|APRON',
+        re.IGNORECASE,
+    )),
+)
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_eaip_base_url(ttl_bucket):
+    """Resolve the latest eAIP base URL from the main page (cached per TTL bucket)."""
+    response = SESSION.get(MAIN_PAGE_URL, timeout=(5, 30))
+    links = _parse_html(response).xpath('//a[@href]')
+    
+    # Find the "Currently Effective" link in the eAIP SR online table
+    # Look for links containing 'eAIP_SR' and 'Currently Effective'
+    for link in links:
+        href = link.get('href')
+        text = stripped_text(link)
+        
+        # Check for Currently Effective eAIP link
+        if 'eAIP_SR' in href and ('Currently Effective' in text or 'AIP_SR_EFF' in href):
+            # Extract the base URL (remove frameset file)
+            # href might be: https://aim.lps.sk/web/eAIP_SR/AIP_SR_EFF_22JAN2026_amdt/html/LZ-frameset-en-SK.html
+            if 'LZ-frameset' in href:
+                base_url = href.rsplit('/', 1)[0] + '/'
+            else:
+                base_url = href
+            
+            if not base_url.endswith('/'):
+                base_url += '/'
+                
+            return base_url
+    
+    # Fallback: search for any AIP_SR_EFF pattern
+    for link in links:
+        href = link.get('href')
+        if 'AIP_SR_EFF_' in href:
+            match = _EAIP_BASE_RE.search(href)
+            if match:
+                return match.group(1)
+    
+    # Raised rather than returned so a miss is not cached
+    raise LookupError("No eAIP link found on main page")
+
 
 def get_latest_eaip_base_url():
     """
@@ -39,44 +106,22 @@ def get_latest_eaip_base_url():
         str: Base URL like 'https://aim.lps.sk/web/eAIP_SR/AIP_SR_EFF_22JAN2026_amdt/html/'
     """
     try:
-        response = requests.get(MAIN_PAGE_URL, timeout=30)
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # Find the "Currently Effective" link in the eAIP SR online table
-        # Look for links containing 'eAIP_SR' and 'Currently Effective'
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            text = link.get_text(strip=True)
-            
-            # Check for Currently Effective eAIP link
-            if 'eAIP_SR' in href and ('Currently Effective' in text or 'AIP_SR_EFF' in href):
-                # Extract the base URL (remove frameset file)
-                # href might be: https://aim.lps.sk/web/eAIP_SR/AIP_SR_EFF_22JAN2026_amdt/html/LZ-frameset-en-SK.html
-                if 'LZ-frameset' in href:
-                    base_url = href.rsplit('/', 1)[0] + '/'
-                else:
-                    base_url = href
-                
-                if not base_url.endswith('/'):
-                    base_url += '/'
-                    
-                return base_url
-        
-        # Fallback: search for any AIP_SR_EFF pattern
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if 'AIP_SR_EFF_' in href:
-                match = re.search(r'(https?://[^"\']+eAIP_SR/AIP_SR_EFF_[^/]+/html/)', href)
-                if match:
-                    return match.group(1)
-        
+        return _fetch_latest_eaip_base_url(int(time.time() // _CACHE_TTL))
+    except LookupError:
         return None
-        
     except Exception as e:
         print(f"Error getting latest eAIP URL: {e}")
         return None
 
 
+def _parse_html(response):
+    """Parse a response body with lxml, honouring a charset declared in the headers."""
+    encoding = declared_encoding(response)
+    parser = lxml_html.HTMLParser(encoding=encoding) if encoding else None
+    # Bytes rather than text: the pages may be served as XML with an encoding declaration
+    return lxml_html.fromstring(response.content, parser=parser)
+
+
 def get_airport_page_url(icao_code, base_url):
     """
     Get the URL for a specific airport's AD 2 page.
@@ -103,32 +148,8 @@ def categorize_chart(chart_name):
     Returns:
         str: Chart category (SID/STAR/Approach/Airport Diagram/General)
     """
-    name_upper = chart_name.upper()
-    
-    # SID charts
-    if any(keyword in name_upper for keyword in ['DEPARTURE', 'SID', 'DEP CHART']):
-        return 'SID'
-    
-    # STAR charts
-    if any(keyword in name_upper for keyword in ['ARRIVAL', 'STAR', 'ARR CHART']):
-        return 'STAR'
-    
-    # Approach charts
-    if any(keyword in name_upper for keyword in [
-        'APPROACH', 'ILS', 'VOR', 'RNP', 'RNAV', 'LOC', 'NDB', 'DME',
-        'INSTRUMENT APPROACH', 'CIRCLING', 'PRECISION APPROACH'
-    ]):
-        return 'Approach'
-    
-    # Airport diagrams / Ground charts
-    if any(keyword in name_upper for keyword in [
-        'AERODROME CHART', 'AIRPORT CHART', 'PARKING', 'DOCKING',
-        'GROUND MOVEMENT', 'TAXI', 'APRON'
-    ]):
-        return 'Airport Diagram'
-    
-    # Everything else is general (obstacles, bird concentrations, noise, ATC surveillance, etc.)
-    return 'General'
+    # Categories are checked in priority order; everything else is general (obstacles, bird concentrations, noise, ATC surveillance, etc.)
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code):
@@ -150,90 +171,8 @@ def get_aerodrome_charts(icao_code):
             print(f"Could not determine eAIP base URL")
             return charts
         
-        # Get airport page URL
-        airport_url = get_airport_page_url(icao_code, base_url)
-        
-        print(f"Fetching {airport_url}")
-        
-        # Get the airport page
-        response = requests.get(airport_url, timeout=30)
-        if response.status_code == 404:
-            print(f"Airport {icao_code} not found in Slovakia eAIP")
-            return charts
-        
-        if response.status_code != 200:
-            print(f"Error: Got status code {response.status_code}")
-            return charts
-        
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # Find all PDF links in the page
-        # Charts are typically in the AD 2.24 section but we'll collect all PDF links
-        # that match the pattern for chart files
-        
-        seen_urls = set()
-        
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            
-            # Only process PDF links
-            if '.pdf' not in href.lower():
-                continue
-            
-            # Get the chart name
-            chart_name = link.get_text(strip=True)
-            
-            # Skip empty names or page references like "AD 2-LZIB-2-1"
-            if not chart_name or chart_name.startswith('AD 2-'):
-                # Try to get name from parent or sibling elements
-                parent_td = link.find_parent('td')
-                if parent_td:
-                    # Look for text in the row
-                    parent_tr = parent_td.find_parent('tr')
-                    if parent_tr:
-                        # Get all text from the row
-                        row_text = parent_tr.get_text(' ', strip=True)
-                        # Extract chart name (usually before "AD 2-")
-                        if 'AD 2-' in row_text:
-                            chart_name = row_text.split('AD 2-')[0].strip()
-                        else:
-                            chart_name = row_text
-            
-            # Clean up chart name
-            if chart_name:
-                chart_name = re.sub(r'\s+', ' ', chart_name).strip()
-                # Remove trailing page references
-                chart_name = re.sub(r'\s*AD\s*2-[A-Z]{4}-\d+-\d+.*$', '', chart_name).strip()
-                
-            # Skip if still no meaningful name
-            if not chart_name or len(chart_name) < 3:
-                continue
-            
-            # Build full URL
-            full_url = urljoin(airport_url, href)
-            
-            # URL encode the PDF filename (spaces and special characters)
-            url_parts = full_url.rsplit('/', 1)
-            if len(url_parts) == 2:
-                url_base, filename = url_parts
-                encoded_filename = quote(filename, safe='')
-                full_url = f"{url_base}/{encoded_filename}"
-            
-            # Skip duplicates
-            if full_url in seen_urls:
-                continue
-            seen_urls.add(full_url)
-            
-            # Categorize the chart
-            chart_type = categorize_chart(chart_name)
-            
-            charts.append({
-                'name': chart_name,
-                'url': full_url,
-                'type': chart_type
-            })
-        
-        return charts
+        # Airport pages don't change within an AIRAC cycle, so they are cached per eAIP edition
+        return _fetch_airport_charts(icao_code, base_url)
         
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 404:
@@ -248,6 +187,124 @@ def get_aerodrome_charts(icao_code):
         return charts
 
 
+@airac_cached('slovakia')
+def _fetch_airport_charts(icao_code, base_url):
+    """Fetch and parse one airport page of the eAIP edition at base_url."""
+    charts = []
+    
+    # Get airport page URL
+    airport_url = get_airport_page_url(icao_code, base_url)
+    
+    print(f"Fetching {airport_url}")
+    
+    # Get the airport page
+    response = SESSION.get(airport_url, timeout=(5, 30))
+    if response.status_code == 404:
+        print(f"Airport {icao_code} not found in Slovakia eAIP")
+        return charts
+    
+    if response.status_code != 200:
+        # Raised rather than returned so the failure is not cached
+        raise requests.exceptions.HTTPError(f"Got status code {response.status_code}", response=response)
+    
+    tree = _parse_html(response)
+    
+    # Find all PDF links in the page
+    # Charts are typically in the AD 2.24 section but we'll collect all PDF links
+    # that match the pattern for chart files
+    
+    seen_urls = set()
+    
+    for link in tree.xpath('//a[contains(translate(@href, "PDF", "pdf"), ".pdf")]'):
+        href = link.get('href')
+        
+        # Get the chart name
+        chart_name = stripped_text(link)
+        
+        # Skip empty names or page references like "AD 2-LZIB-2-1"
+        if not chart_name or chart_name.startswith('AD 2-'):
+            # Try to get name from the enclosing table row
+            parent_tr = link.xpath('ancestor::td[1]/ancestor::tr[1]')
+            if parent_tr:
+                # Get all text from the row
+                row_text = stripped_text(parent_tr[0], ' ')
+                # Extract chart name (usually before "AD 2-")
+                if 'AD 2-' in row_text:
+                    chart_name = row_text.split('AD 2-')[0].strip()
+                else:
+                    chart_name = row_text
+        
+        # Clean up chart name
+        if chart_name:
+            chart_name = _WS_RE.sub(' ', chart_name).strip()
+            # Remove trailing page references
+            chart_name = _PAGE_REF_RE.sub('', chart_name).strip()
+            
+        # Skip if still no meaningful name
+        if not chart_name or len(chart_name) < 3:
+            continue
+        
+        # Build full URL, encoding spaces and special characters in the link
+        full_url = urljoin(airport_url, quote_href(href))
+        
+        # Skip duplicates
+        if full_url in seen_urls:
+            continue
+        seen_urls.add(full_url)
+        
+        # Categorize the chart
+        chart_type = categorize_chart(chart_name)
+        
+        charts.append({
+            'name': chart_name,
+            'url': full_url,
+            'type': chart_type
+        })
+    
+    return charts
+
+
+def get_aerodrome_charts_many(icao_codes, max_workers=8):
+    """
+    Fetch aerodrome charts for several ICAO codes in parallel.
+    
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        max_workers: Number of airport pages fetched in parallel
+        
+    Returns:
+        dict: Upper-cased ICAO code -> list of chart dictionaries
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    # Resolve the eAIP base once so the workers don't all race to fetch it
+    if not get_latest_eaip_base_url():
+        print(f"Could not determine eAIP base URL")
+        return {code: [] for code in icao_codes}
+    
+    return dict(zip(icao_codes, map_threaded(get_aerodrome_charts, icao_codes, max_workers)))
+
+
+async def get_aerodrome_charts_many_async(icao_codes, limit=8):
+    """
+    Fetch aerodrome charts for several ICAO codes from async code.
+    
+    Args:
+        icao_codes: Iterable of 4-letter ICAO codes
+        limit: Maximum number of airport pages fetched at once
+        
+    Returns:
+        dict: Upper-cased ICAO code -> list of chart dictionaries
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    if not await asyncio.to_thread(get_latest_eaip_base_url):
+        print(f"Could not determine eAIP base URL")
+        return {code: [] for code in icao_codes}
+    
+    return dict(zip(icao_codes, await gather_threaded(get_aerodrome_charts, icao_codes, limit)))
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: python slovakia_scraper.py <ICAO_CODE>")
@@ -4,33 +4,66 @@ Handles airports with LJ* prefix (LJLJ, LJMB, LJPZ, LJCE)
 Base URL: https://aim.sloveniacontrol.si/aim/eAIP/Operations/
 """
 
-import urllib.request
-import ssl
-from html.parser import HTMLParser
+import asyncio
 from urllib.parse import urljoin, quote
+import os
 import re
+import sys
+import time
+from functools import lru_cache
 
+import urllib3
+from lxml import html as lxml_html
 
-def get_latest_airac_folder():
-    """Get the latest AIRAC folder from Slovenia eAIP history page."""
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, airac_cached, categorize_by_patterns, declared_encoding, gather_threaded, map_threaded
+
+# The eAIP host's certificate does not verify; silence the per-request warning
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# The history page is re-read at most once per hour
+_CACHE_TTL = 3600
+
+# AIRAC links on the history page, e.g.
+# <a href="../Operations/2026-02-19-AIRAC/html/index.html">19 FEB 2026</a>
+# (ASCII, so matched on the raw body without decoding it)
+_AIRAC_LINK_RE = re.compile(rb'href="../Operations/([^/]+)/html/index\.html"')
+
+# Chart title keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'departure|sid', re.IGNORECASE)),
+    ('STAR', re.compile(r'arrival|star', re.IGNORECASE)),
+    ('Approach', re.compile(r'approach|ils|rnp|vor|loc', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(r'parking|docking|aerodrome chart', re.IGNORECASE)),
+)
+
+
+@lru_cache(maxsize=1)
+def _fetch_latest_airac_folder(ttl_bucket):
+    """Fetch the latest AIRAC folder from the history page (cached per TTL bucket)."""
     history_url = "https://aim.sloveniacontrol.si/aim/eAIP/Operations/history-en-GB.html"
     
-    context = ssl._create_unverified_context()
-    req = urllib.request.Request(history_url)
+    response = SESSION.get(history_url, verify=False, timeout=30)
+    response.raise_for_status()
     
-    with urllib.request.urlopen(req, context=context) as response:
-        html_content = response.read().decode('utf-8')
+    # The latest AIRAC (class="Red" or class="green") is listed first
+    match = _AIRAC_LINK_RE.search(response.content)
+    if not match:
+        # Raised rather than returned so a miss is not cached
+        raise LookupError("No AIRAC folder found on history page")
     
-    # Find the latest AIRAC (class="Red" or class="green")
-    # Pattern: <a href="../Operations/2026-02-19-AIRAC/html/index.html">19 FEB 2026</a>
-    pattern = r'href="../Operations/([^/]+)/html/index\.html"'
-    matches = re.findall(pattern, html_content)
-    
-    if matches:
-        # Return the first match (should be the latest)
-        return matches[0]
-    
-    return None
+    return match.group(1).decode('utf-8')
+
+
+def get_latest_airac_folder():
+    """Get the latest AIRAC folder from Slovenia eAIP history page."""
+    try:
+        return _fetch_latest_airac_folder(int(time.time() // _CACHE_TTL))
+    except LookupError:
+        return None
 
 
 def get_airport_page_url(icao, airac_folder):
@@ -43,90 +76,66 @@ def get_airport_page_url(icao, airac_folder):
     return airport_page
 
 
-class ChartLinksParser(HTMLParser):
-    """Parser to extract chart links from AD 2.24 table."""
-    
-    def __init__(self):
-        super().__init__()
-        self.in_ad_224 = False
-        self.in_table = False
-        self.in_row = False
-        self.in_first_td = False
-        self.in_second_td = False
-        self.charts = []
-        self.last_chart_id = None  # Keep last chart ID across rows
-        self.last_chart_title = None  # Keep last title across rows
-        self.collecting_title = False
-        self.td_count = 0
-        self.row_number = 0
-    
-    def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
-        
-        # Check if we're entering AD 2.24 section
-        div_id = attrs_dict.get('id', '')
-        if tag == 'div' and 'AD-2.24' in div_id:
-            self.in_ad_224 = True
-        
-        # Look for table in AD 2.24 section
-        if self.in_ad_224 and tag == 'table':
-            self.in_table = True
-        
-        # Track rows in the table
-        if self.in_table and tag == 'tr':
-            self.in_row = True
-            self.td_count = 0
-            self.row_number += 1
-        
-        # Track table cells
-        if self.in_row and tag == 'td':
-            self.td_count += 1
-            rowspan = attrs_dict.get('rowspan', '1')
+def _parse_html(response):
+    """
+    Parse an eAIP page with lxml.
+    
+    The body is parsed from bytes (the pages may carry an XML encoding
+    declaration) as UTF-8 unless the headers declare another charset;
+    malformed bytes are replaced rather than failing the whole page.
+    """
+    try:
+        parser = lxml_html.HTMLParser(encoding=declared_encoding(response) or 'utf-8')
+    except LookupError:
+        # Unknown charset name in the header
+        parser = lxml_html.HTMLParser(encoding='utf-8')
+    return lxml_html.fromstring(response.content, parser=parser)
+
+
+def _first_text(cell):
+    """First non-blank text run inside a table cell, stripped."""
+    for text in cell.itertext():
+        text = text.strip()
+        if text:
+            return text
+    return None
+
+
+def _parse_chart_links(tree):
+    """
+    Extract chart links from the AD 2.24 table.
+    
+    Each chart takes two rows: the first holds the chart ID (first cell,
+    rowspan="2") and the title (second cell), the second holds the PDF
+    link(s). The last ID and title seen are kept across rows.
+    """
+    charts = []
+    last_chart_id = None
+    last_chart_title = None
+    
+    for row in tree.xpath('//div[contains(@id, "AD-2.24")]//table//tr'):
+        # Cells and links in document order, so a link only sees the
+        # ID and title of the cells before it
+        td_count = 0
+        for element in row.iter('td', 'a'):
+            if element.tag == 'td':
+                td_count += 1
+                # First td with rowspan="2" contains chart ID
+                if td_count == 1 and element.get('rowspan', '1') == '2':
+                    last_chart_id = _first_text(element) or last_chart_id
+                # Second td contains title
+                elif td_count == 2:
+                    last_chart_title = _first_text(element) or last_chart_title
             
-            # First td with rowspan="2" contains chart ID
-            if self.td_count == 1 and rowspan == '2':
-                self.in_first_td = True
-            # Second td in first row contains title
-            elif self.td_count == 2:
-                self.in_second_td = True
-                self.collecting_title = True
-        
-        # Look for PDF links in the <a> tag
-        if self.in_table and tag == 'a':
-            href = attrs_dict.get('href', '')
-            if href and '.pdf' in href:
-                # Use the last saved chart ID and title
-                if self.last_chart_title and self.last_chart_id:
-                    self.charts.append({
-                        'id': self.last_chart_id,
-                        'title': self.last_chart_title,
-                        'url': href
-                    })
-    
-    def handle_data(self, data):
-        data = data.strip()
-        if not data:
-            return
-        
-        # Collect chart ID from first td
-        if self.in_first_td:
-            self.last_chart_id = data
-            self.in_first_td = False
-        
-        # Collect chart title from second td
-        if self.collecting_title and self.in_second_td:
-            self.last_chart_title = data
-            self.collecting_title = False
-    
-    def handle_endtag(self, tag):
-        if tag == 'td':
-            self.in_second_td = False
-        elif tag == 'tr':
-            self.in_row = False
-        elif tag == 'table':
-            self.in_table = False
-        elif tag == 'div' and self.in_ad_224:
-            self.in_ad_224 = False
+            # PDF links use the last saved chart ID and title
+            elif last_chart_title and last_chart_id and '.pdf' in element.get('href', ''):
+                charts.append({
+                    'id': last_chart_id,
+                    'title': last_chart_title,
+                    'url': element.get('href')
+                })
+    
+    return charts
 
 
 def categorize_chart(title):
@@ -134,19 +143,7 @@ def categorize_chart(title):
     if not title:
         return 'General'
     
-    title_lower = title.lower()
-    
-    # Specific pattern matching
-    if 'departure' in title_lower or 'sid' in title_lower:
-        return 'SID'
-    elif 'arrival' in title_lower or 'star' in title_lower:
-        return 'STAR'
-    elif 'approach' in title_lower or 'ils' in title_lower or 'rnp' in title_lower or 'vor' in title_lower or 'loc' in title_lower:
-        return 'Approach'
-    elif 'parking' in title_lower or 'docking' in title_lower or 'aerodrome chart' in title_lower:
-        return 'Airport Diagram'
-    else:
-        return 'General'
+    return categorize_by_patterns(title, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao):
@@ -164,28 +161,33 @@ def get_aerodrome_charts(icao):
     if not airac_folder:
         return []
     
+    # Airport pages don't change within an AIRAC cycle, so they are cached per AIRAC folder
+    try:
+        return _fetch_airport_charts(icao, airac_folder)
+    except Exception:
+        return []
+
+
+@airac_cached('slovenia')
+def _fetch_airport_charts(icao, airac_folder):
+    """Fetch and parse one airport page of the given AIRAC folder."""
     # Construct airport page URL
     airport_page_url = get_airport_page_url(icao, airac_folder)
     
-    # Download airport page
-    context = ssl._create_unverified_context()
-    req = urllib.request.Request(airport_page_url)
-    
-    try:
-        with urllib.request.urlopen(req, context=context) as response:
-            html_content = response.read().decode('utf-8')
-    except:
-        return []
+    # Download airport page (over the pooled connection opened for the history page);
+    # errors are raised rather than returned so they are not cached
+    response = SESSION.get(airport_page_url, verify=False, timeout=30)
+    response.raise_for_status()
+    tree = _parse_html(response)
     
     # Parse charts
-    parser = ChartLinksParser()
-    parser.feed(html_content)
+    chart_links = _parse_chart_links(tree)
     
     # Convert relative URLs to absolute and encode filenames
     base_url = f"https://aim.sloveniacontrol.si/aim/eAIP/Operations/{airac_folder}"
     charts = []
     
-    for chart in parser.charts:
+    for chart in chart_links:
         # chart['url'] is like ../../graphics/eAIP/LJ_AD_2_LJLJ_01-1_en.pdf
         # Need to resolve relative path
         if chart['url'].startswith('../../graphics/eAIP/'):
@@ -204,3 +206,42 @@ def get_aerodrome_charts(icao):
         })
     
     return charts
+
+
+def get_aerodrome_charts_many(icao_codes, max_workers=8):
+    """
+    Fetch aerodrome charts for several Slovenian airports in parallel.
+    
+    Args:
+        icao_codes: Iterable of ICAO codes (e.g., ['LJLJ', 'LJMB'])
+        max_workers: Number of airport pages fetched in parallel
+    
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    # Resolve the AIRAC folder once so the workers don't all race to fetch it
+    if not get_latest_airac_folder():
+        return {code: [] for code in icao_codes}
+    
+    return dict(zip(icao_codes, map_threaded(get_aerodrome_charts, icao_codes, max_workers)))
+
+
+async def get_aerodrome_charts_many_async(icao_codes, limit=8):
+    """
+    Fetch aerodrome charts for several Slovenian airports from async code.
+    
+    Args:
+        icao_codes: Iterable of ICAO codes (e.g., ['LJLJ', 'LJMB'])
+        limit: Maximum number of airport pages fetched at once
+    
+    Returns:
+        Dict mapping each upper-cased ICAO code to its list of charts
+    """
+    icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+    
+    if not await asyncio.to_thread(get_latest_airac_folder):
+        return {code: [] for code in icao_codes}
+    
+    return dict(zip(icao_codes, await gather_threaded(get_aerodrome_charts, icao_codes, limit)))
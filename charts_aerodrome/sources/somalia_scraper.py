@@ -26,8 +26,11 @@ Chart extraction approach (similar to Canada/Djibouti):
 
 import os
 import re
+import shutil
 import sys
 import tempfile
+import threading
+import traceback
 from typing import List, Dict, Optional
 from urllib.parse import urljoin
 
@@ -37,11 +40,16 @@ try:
 except ImportError:
     FITZ_AVAILABLE = False
 
-try:
-    import urllib.request
-    import ssl
-except ImportError:
-    pass
+import urllib3
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns
+
+# The ICAO FISS host is fetched without certificate verification; silence the warning
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 # Base URLs
@@ -60,6 +68,34 @@ AIRPORTS = {
     'HCMV': {'name': 'Baidoa', 'start_page': 66, 'end_page': 67},
 }
 
+# Opened AIP document and the text of its pages read so far (None until a
+# page is first read), keyed by (path, mtime) so a re-downloaded file is reopened
+_DOC_CACHE = {}
+# PyMuPDF documents are not thread-safe; calls sharing the cached one take turns
+_DOC_LOCK = threading.Lock()
+
+# Chart page reference, e.g. "AD 2-15"
+_AD_REF_RE = re.compile(r'AD\s*2-(\d+)')
+# Runway designator on a chart page (matched against the upper-cased text)
+_RWY_RE = re.compile(r'RWY\s*(\d+)')
+# Approach designation: the runway with the Y/Z variant letter standing
+# just before or after it, e.g. "RNAV (GNSS) Z RWY 05" (upper-cased text)
+_APPROACH_RWY_RE = re.compile(r'(?:(?<![A-Z0-9])([YZ])\s+)?RWY\s*(\d+)(?:\s+([YZ])(?![A-Z0-9]))?')
+# Every chart check in identify_charts_in_section needs one of these words,
+# so pages without any of them (text, tables, blank pages) are skipped early
+_CHART_HINT_RE = re.compile(r'CHART|DEPARTURE|SID|ARRIVAL|APPROACH|SCALE', re.IGNORECASE)
+# Characters not allowed in extracted chart filenames
+_FILENAME_UNSAFE_RE = re.compile(r'[<>:"/\\|?*\s]+')
+
+# Chart name keywords, one alternation per category in priority order
+# (so departures are never taken for approaches)
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|DEPARTURE', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|ARRIVAL', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|IAC|RNAV|RNP|ILS|VOR|NDB', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(r'AERODROME CHART|AIRPORT CHART|PARKING|DOCKING|GROUND', re.IGNORECASE)),
+)
+
 
 def download_pdf(cache_path: str) -> bool:
     """
@@ -71,30 +107,60 @@ def download_pdf(cache_path: str) -> bool:
     Returns:
         bool: True if download successful
     """
+    # Downloaded next to the cache file and renamed into place, so an
+    # interrupted download never leaves a partial PDF that looks cached
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     try:
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        
-        req = urllib.request.Request(PDF_URL, headers={
+        headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        }
         
-        with urllib.request.urlopen(req, context=ctx, timeout=120) as response:
-            pdf_data = response.read()
+        with SESSION.get(PDF_URL, headers=headers, verify=False, timeout=120, stream=True) as response:
+            response.raise_for_status()
             
             os.makedirs(os.path.dirname(cache_path), exist_ok=True)
             
-            with open(cache_path, 'wb') as f:
-                f.write(pdf_data)
+            # Copied in 1 MB pieces rather than holding the whole PDF in memory
+            response.raw.decode_content = True
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, 1 << 20)
+            os.replace(tmp_path, cache_path)
             
             return True
             
     except Exception as e:
         print(f"Error downloading PDF: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
         return False
 
 
+def _open_document(path: str):
+    """
+    Open the AIP PDF, reusing the document opened by earlier calls.
+    
+    Must be called with _DOC_LOCK held.
+    
+    Args:
+        path: Local path of the PDF
+        
+    Returns:
+        tuple: (PyMuPDF document, list of page texts shared by the calls)
+    """
+    key = (path, os.path.getmtime(path))
+    cached = _DOC_CACHE.get(key)
+    if cached is None:
+        # The file changed since it was opened - drop the old document
+        for stale_doc, _ in _DOC_CACHE.values():
+            stale_doc.close()
+        _DOC_CACHE.clear()
+        doc = fitz.open(path)
+        cached = _DOC_CACHE[key] = (doc, [None] * len(doc))
+    return cached
+
+
 def categorize_chart(chart_name: str) -> str:
     """
     Categorize chart based on its name.
@@ -105,34 +171,11 @@ def categorize_chart(chart_name: str) -> str:
     Returns:
         Category string
     """
-    name_upper = chart_name.upper()
-    
-    # SID
-    if 'SID' in name_upper or 'DEPARTURE' in name_upper:
-        return 'SID'
-    
-    # STAR
-    if 'STAR' in name_upper or 'ARRIVAL' in name_upper:
-        return 'STAR'
-    
-    # Approach charts
-    if any(keyword in name_upper for keyword in [
-        'APPROACH', 'IAC', 'RNAV', 'RNP', 'ILS', 'VOR', 'NDB'
-    ]):
-        # But not if it's specifically a departure
-        if 'DEPARTURE' not in name_upper and 'SID' not in name_upper:
-            return 'Approach'
-    
-    # Ground/Airport diagrams
-    if any(keyword in name_upper for keyword in [
-        'AERODROME CHART', 'AIRPORT CHART', 'PARKING', 'DOCKING', 'GROUND'
-    ]):
-        return 'Airport Diagram'
-    
-    return 'General'
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
-def identify_charts_in_section(doc, start_page: int, end_page: int, icao_code: str) -> List[Dict]:
+def identify_charts_in_section(doc, start_page: int, end_page: int, icao_code: str,
+                               page_texts: Optional[List[Optional[str]]] = None) -> List[Dict]:
     """
     Identify chart pages within an airport section.
     
@@ -141,17 +184,29 @@ def identify_charts_in_section(doc, start_page: int, end_page: int, icao_code: s
         start_page: Start page (1-indexed)
         end_page: End page (1-indexed)
         icao_code: ICAO code
+        page_texts: Optional per-page text cache for doc (None for pages not
+            read yet); pages read here are stored in it for later calls
         
     Returns:
         List of chart dictionaries with page numbers and names
     """
     charts = []
+    # Names already added, keyed by (base name, runway); names without a
+    # runway only match themselves
+    seen = set()
     
     for page_idx in range(start_page - 1, min(end_page, len(doc))):
-        page = doc[page_idx]
-        text = page.get_text()
+        if page_texts is None:
+            text = doc[page_idx].get_text()
+        else:
+            text = page_texts[page_idx]
+            if text is None:
+                text = page_texts[page_idx] = doc[page_idx].get_text()
         page_num = page_idx + 1
         
+        if not _CHART_HINT_RE.search(text):
+            continue
+        
         chart_name = None
         chart_type = None
         
@@ -166,8 +221,14 @@ def identify_charts_in_section(doc, start_page: int, end_page: int, icao_code: s
         if 'AERONAUTICAL DATA CALCULATION' in text_upper and 'AD 2-' not in text_upper:
             continue
         
-        # Aerodrome Chart - graphical chart
-        if 'AERODROME CHART' in text_upper and ('ICAO' in text_upper or 'NOT TO SCALE' in text_upper or 'SCALE' in text_upper):
+        # Keywords tested by more than one of the checks below
+        has_rnav = 'RNAV' in text_upper
+        has_rnp = 'RNP' in text_upper
+        has_departure = 'DEPARTURE' in text_upper
+        has_arrival = 'ARRIVAL' in text_upper
+        
+        # Aerodrome Chart - graphical chart ('SCALE' also covers 'NOT TO SCALE')
+        if 'AERODROME CHART' in text_upper and ('ICAO' in text_upper or 'SCALE' in text_upper):
             chart_name = f"{icao_code} - Aerodrome Chart ICAO"
             chart_type = 'Airport Diagram'
         
@@ -178,71 +239,75 @@ def identify_charts_in_section(doc, start_page: int, end_page: int, icao_code: s
                 chart_type = 'Airport Diagram'
         
         # SID - Check for the graphical SID chart (page with AD 2-15 identifier)
-        elif ('DEPARTURE' in text_upper and 'RNAV' in text_upper) or ('SID' in text_upper and 'RWY' in text_upper):
+        elif (has_departure and has_rnav) or ('SID' in text_upper and 'RWY' in text_upper):
             # Check if this is a graphical chart page (has AD 2-xx reference for charts)
-            ad_ref = re.search(r'AD\s*2-(\d+)', text)
+            ad_ref = _AD_REF_RE.search(text)
             if ad_ref:
-                rwy_match = re.search(r'RWY\s*(\d+)', text_upper)
+                rwy_match = _RWY_RE.search(text_upper)
                 rwy = rwy_match.group(1) if rwy_match else '23'
                 chart_name = f"{icao_code} - SID RNAV (GNSS) RWY {rwy}"
                 chart_type = 'SID'
         
         # STAR - Standard Terminal Arrival
-        elif 'ARRIVAL' in text_upper and 'RNAV' in text_upper and 'STAR' not in text_upper:
-            ad_ref = re.search(r'AD\s*2-(\d+)', text)
+        elif has_arrival and has_rnav and 'STAR' not in text_upper:
+            ad_ref = _AD_REF_RE.search(text)
             if ad_ref:
-                rwy_match = re.search(r'RWY\s*(\d+)', text_upper)
+                rwy_match = _RWY_RE.search(text_upper)
                 rwy = rwy_match.group(1) if rwy_match else '05'
                 chart_name = f"{icao_code} - STAR RNAV (GNSS) RWY {rwy}"
                 chart_type = 'STAR'
         
         # RNAV/RNP Approach - look for specific approach indicators
-        elif ('APPROACH' in text_upper and ('RNAV' in text_upper or 'RNP' in text_upper)):
-            if 'DEPARTURE' not in text_upper and 'ARRIVAL' not in text_upper:
-                ad_ref = re.search(r'AD\s*2-(\d+)', text)
+        elif 'APPROACH' in text_upper and (has_rnav or has_rnp):
+            if not has_departure and not has_arrival:
+                ad_ref = _AD_REF_RE.search(text)
                 if ad_ref:
-                    rwy_match = re.search(r'RWY\s*(\d+)', text_upper)
-                    rwy = rwy_match.group(1) if rwy_match else '05'
+                    # Runway and variant (Y or Z) from one match
+                    designation = _APPROACH_RWY_RE.search(text_upper)
+                    if designation:
+                        rwy = designation.group(2)
+                        variant = designation.group(1) or designation.group(3)
+                    else:
+                        rwy = '05'
+                        variant = None
+                    
+                    # Without a letter next to the runway, fall back to any Y/Z on the page
+                    if not variant:
+                        if has_rnp:
+                            variant = 'Z' if 'Z' in text_upper else 'Y' if 'Y' in text else ''
+                        else:
+                            variant = 'Z' if 'Z' in text else 'Y' if 'Y' in text else ''
                     
-                    # Check if RNP or GNSS and get variant (Y or Z)
-                    if 'RNP' in text_upper and 'Z' in text_upper:
-                        chart_name = f"{icao_code} - RNAV (RNP) Z RWY {rwy}"
-                    elif 'RNP' in text_upper:
-                        variant = 'Y' if 'Y' in text else ''
-                        chart_name = f"{icao_code} - RNAV (RNP) {variant} RWY {rwy}"
+                    # Check if RNP or GNSS
+                    if has_rnp:
+                        procedure = 'RNAV (RNP)'
                     elif 'GNSS' in text_upper:
-                        variant = 'Z' if 'Z' in text else 'Y' if 'Y' in text else ''
-                        chart_name = f"{icao_code} - RNAV (GNSS) {variant} RWY {rwy}"
+                        procedure = 'RNAV (GNSS)'
                     else:
-                        variant = 'Z' if 'Z' in text else 'Y' if 'Y' in text else ''
-                        chart_name = f"{icao_code} - RNAV {variant} RWY {rwy}"
+                        procedure = 'RNAV'
+                    if variant:
+                        procedure = f"{procedure} {variant}"
+                    chart_name = f"{icao_code} - {procedure} RWY {rwy}"
                     chart_type = 'Approach'
         
         # Check if it's a graphical chart page (has coordinates/scale and AD reference)
-        elif any(x in text for x in ['Scale 1:', 'SCALE 1:', 'NOT TO SCALE']) and icao_code in text:
+        elif ('Scale 1:' in text or 'SCALE 1:' in text or 'NOT TO SCALE' in text) and icao_code in text:
             # Only add if not already added and has AD reference
-            ad_ref = re.search(r'AD\s*2-(\d+)', text)
+            ad_ref = _AD_REF_RE.search(text)
             if ad_ref:
                 if 'AERODROME' in text_upper:
                     chart_name = f"{icao_code} - Aerodrome Chart"
                     chart_type = 'Airport Diagram'
         
         if chart_name:
-            # Check for duplicates by name (not exact match, but similar)
-            is_duplicate = False
-            for c in charts:
-                # Simple duplicate check - same base name
-                if chart_name.split(' RWY')[0] == c['name'].split(' RWY')[0]:
-                    # Check if same runway
-                    if 'RWY' in chart_name and 'RWY' in c['name']:
-                        if chart_name.split('RWY ')[-1] == c['name'].split('RWY ')[-1]:
-                            is_duplicate = True
-                            break
-                    elif chart_name == c['name']:
-                        is_duplicate = True
-                        break
+            # Skip duplicates - same base name and same runway
+            if 'RWY' in chart_name:
+                key = (chart_name.split(' RWY')[0], chart_name.rpartition('RWY ')[2])
+            else:
+                key = (chart_name, None)
             
-            if not is_duplicate:
+            if key not in seen:
+                seen.add(key)
                 charts.append({
                     'name': chart_name,
                     'page': page_num,
@@ -269,15 +334,16 @@ def extract_chart_page(doc, page_num: int, icao_code: str, chart_name: str, outp
     os.makedirs(output_dir, exist_ok=True)
     
     # Sanitize filename
-    safe_name = re.sub(r'[<>:"/\\|?*\s]+', '_', chart_name)
+    safe_name = _FILENAME_UNSAFE_RE.sub('_', chart_name)
     safe_name = safe_name[:50]  # Limit length
     pdf_filename = f"{safe_name}.pdf"
     pdf_path = os.path.join(output_dir, pdf_filename)
     
-    # Create new PDF with single page
+    # Create new PDF with single page; links are left out since they would
+    # point at pages that are not copied
     new_doc = fitz.open()
-    new_doc.insert_pdf(doc, from_page=page_num - 1, to_page=page_num - 1)
-    new_doc.save(pdf_path)
+    new_doc.insert_pdf(doc, from_page=page_num - 1, to_page=page_num - 1, links=False)
+    new_doc.save(pdf_path, deflate=True)
     new_doc.close()
     
     return pdf_path
@@ -327,60 +393,60 @@ def get_aerodrome_charts(icao_code: str, extract_pdfs: bool = False) -> List[Dic
             return []
         print(f"PDF cached to {cache_file}")
     
-    # Open and process the PDF
+    # Open and process the PDF (the opened document is kept for later calls)
     try:
-        doc = fitz.open(cache_file)
-        print(f"PDF has {len(doc)} pages")
-        print(f"Processing {icao_code} - {airport_info['name']} (pages {airport_info['start_page']}-{airport_info['end_page']})")
-        
-        # Identify charts in this airport's section
-        chart_defs = identify_charts_in_section(
-            doc,
-            airport_info['start_page'],
-            airport_info['end_page'],
-            icao_code
-        )
-        
-        if not chart_defs:
-            print(f"No charts found for {icao_code}")
-            # Return at least a reference to the airport section
-            chart_defs = [{
-                'name': f"{icao_code} - {airport_info['name']} AD 2",
-                'page': airport_info['start_page'],
-                'type': 'General'
-            }]
-        
-        charts = []
-        output_dir = os.path.join(os.getcwd(), "output", "somalia", icao_code)
-        
-        for chart_def in chart_defs:
-            chart_name = chart_def['name']
-            page_num = chart_def['page']
-            chart_type = chart_def['type']
+        with _DOC_LOCK:
+            doc, page_texts = _open_document(cache_file)
+            print(f"PDF has {len(doc)} pages")
+            print(f"Processing {icao_code} - {airport_info['name']} (pages {airport_info['start_page']}-{airport_info['end_page']})")
+            
+            # Identify charts in this airport's section
+            chart_defs = identify_charts_in_section(
+                doc,
+                airport_info['start_page'],
+                airport_info['end_page'],
+                icao_code,
+                page_texts
+            )
+            
+            if not chart_defs:
+                print(f"No charts found for {icao_code}")
+                # Return at least a reference to the airport section
+                chart_defs = [{
+                    'name': f"{icao_code} - {airport_info['name']} AD 2",
+                    'page': airport_info['start_page'],
+                    'type': 'General'
+                }]
+            
+            charts = []
+            output_dir = os.path.join(os.getcwd(), "output", "somalia", icao_code)
             
-            if extract_pdfs:
-                try:
-                    pdf_path = extract_chart_page(doc, page_num, icao_code, chart_name, output_dir)
-                    chart_url = f"file:///{os.path.abspath(pdf_path).replace(os.sep, '/')}"
-                except Exception as e:
-                    print(f"Warning: Failed to extract page {page_num}: {e}")
+            for chart_def in chart_defs:
+                chart_name = chart_def['name']
+                page_num = chart_def['page']
+                chart_type = chart_def['type']
+                
+                if extract_pdfs:
+                    try:
+                        pdf_path = extract_chart_page(doc, page_num, icao_code, chart_name, output_dir)
+                        chart_url = f"file:///{os.path.abspath(pdf_path).replace(os.sep, '/')}"
+                    except Exception as e:
+                        print(f"Warning: Failed to extract page {page_num}: {e}")
+                        chart_url = f"file:///{os.path.abspath(cache_file).replace(os.sep, '/')}#page={page_num}"
+                else:
                     chart_url = f"file:///{os.path.abspath(cache_file).replace(os.sep, '/')}#page={page_num}"
-            else:
-                chart_url = f"file:///{os.path.abspath(cache_file).replace(os.sep, '/')}#page={page_num}"
+                
+                charts.append({
+                    'name': chart_name,
+                    'url': chart_url,
+                    'type': chart_type,
+                    'page': page_num
+                })
             
-            charts.append({
-                'name': chart_name,
-                'url': chart_url,
-                'type': chart_type,
-                'page': page_num
-            })
-        
-        doc.close()
-        return charts
+            return charts
         
     except Exception as e:
         print(f"Error processing PDF: {e}")
-        import traceback
         traceback.print_exc()
         return []
 
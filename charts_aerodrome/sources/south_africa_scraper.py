@@ -13,15 +13,45 @@ Examples: FAOR (O.R. Tambo), FACT (Cape Town), FALE (King Shaka/Durban)
 """
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from urllib.parse import quote
+import os
 import re
-from typing import List, Dict
+import sys
+import time
+import traceback
+from functools import lru_cache
+from typing import List, Dict, Tuple
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import airac_cached, categorize_by_patterns, declared_encoding, stripped_text
 
 
 BASE_URL = "https://www.caa.co.za/industry-information/aeronautical-information-aeronautical-charts/"
 BLOB_BASE = "https://caasanwebsitestorage.blob.core.windows.net/aeronautical-charts/"
 
+# The chart page carries no AIRAC identifier, so it is re-read at most
+# once per day and parsed chart lists are cached per day
+_CHART_LIST_TTL = 86400
+
+# ICAO codes in the airport cells, e.g. "O.R Tambo INTL- FAOR"
+_ICAO_RE = re.compile(r'(?<![A-Z])FA[A-Z]{2}(?![A-Z])')
+
+# Chart type keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|DEPARTURE', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|ARRIVAL', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|VOR|RNAV|RNP|NDB', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(
+        r'AERODROME|HELIPORT|PARKING|DOCKING|GROUND MOVEMENT|TAXI'
+        r'|HOTSPOT|HOT SPOT|RESTRICTED VISIBILITY|HELICOPTER',
+        re.IGNORECASE,
+    )),
+)
+
 
 def categorize_chart(chart_type: str, chart_name: str) -> str:
     """
@@ -34,32 +64,9 @@ def categorize_chart(chart_type: str, chart_name: str) -> str:
     Returns:
         Category string (SID, STAR, Approach, Airport Diagram, General)
     """
-    chart_type_upper = chart_type.upper()
-    chart_name_upper = chart_name.upper()
-    
-    # SID - Standard Instrument Departure
-    if 'SID' in chart_type_upper or 'DEPARTURE' in chart_type_upper:
-        return 'SID'
-    
-    # STAR - Standard Terminal Arrival
-    if 'STAR' in chart_type_upper or 'ARRIVAL' in chart_type_upper:
-        return 'STAR'
-    
-    # Approach charts
-    if any(keyword in chart_type_upper for keyword in [
-        'APPROACH', 'ILS', 'VOR', 'RNAV', 'RNP', 'NDB', 'PRECISION APPROACH', 'INSTRUMENT APPROACH'
-    ]):
-        return 'Approach'
-    
-    # Airport diagrams and ground charts
-    if any(keyword in chart_type_upper for keyword in [
-        'AERODROME', 'HELIPORT', 'PARKING', 'DOCKING', 'GROUND MOVEMENT',
-        'TAXI', 'HOTSPOT', 'HOT SPOT', 'RESTRICTED VISIBILITY', 'HELICOPTER'
-    ]):
-        return 'Airport Diagram'
-    
-    # General - obstacles, radar, terrain, etc.
-    return 'General'
+    # Only the type column decides; anything unmatched (obstacles, radar,
+    # terrain, etc.) is general
+    return categorize_by_patterns(chart_type, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code: str) -> List[Dict[str, str]]:
@@ -73,86 +80,133 @@ def get_aerodrome_charts(icao_code: str) -> List[Dict[str, str]]:
         List of dictionaries with 'name', 'url', and 'type' keys
     """
     icao_code = icao_code.upper()
-    charts = []
     
     try:
-        # Fetch the main page
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(BASE_URL, headers=headers, timeout=60)
-        response.raise_for_status()
+        return _fetch_airport_charts(icao_code, str(int(time.time() // _CHART_LIST_TTL)))
+    except Exception as e:
+        print(f"Error fetching charts for {icao_code}: {e}")
+        traceback.print_exc()
+        return []
+
+
+def get_all_charts() -> Dict[str, List[Dict[str, str]]]:
+    """
+    Get the charts of every airport listed on the South Africa CAA page.
+    
+    The page is downloaded and parsed once for all airports.
+    
+    Returns:
+        Dict mapping each ICAO code found on the page to its list of charts
+    """
+    try:
+        rows_by_icao = _fetch_chart_index(int(time.time() // _CHART_LIST_TTL))
+    except Exception as e:
+        print(f"Error fetching chart page: {e}")
+        traceback.print_exc()
+        return {}
+    
+    return {
+        icao_code: [_chart_entry(icao_code, row) for row in rows]
+        for icao_code, rows in rows_by_icao.items()
+    }
+
+
+@airac_cached('south_africa')
+def _fetch_airport_charts(icao_code: str, ttl_bucket: str) -> List[Dict[str, str]]:
+    """Collect one airport's charts from the chart page (cached per TTL bucket)."""
+    return [
+        _chart_entry(icao_code, row)
+        for row in _fetch_chart_index(int(ttl_bucket)).get(icao_code, ())
+    ]
+
+
+def _chart_entry(icao_code: str, row: Tuple[str, str, str, str, str]) -> Dict[str, str]:
+    """Build the chart dictionary of one chart row for the given airport."""
+    _, chart_type, chart_name, chart_url, category = row
+    
+    # Build chart name
+    full_name = f"{icao_code} - {chart_name}"
+    if chart_type and chart_type not in chart_name:
+        # Add chart type if not redundant
+        if 'Chart' not in chart_name:
+            full_name = f"{icao_code} - {chart_type}: {chart_name}"
+    
+    return {
+        'name': full_name,
+        'url': chart_url,
+        'type': category
+    }
+
+
+@lru_cache(maxsize=1)
+def _fetch_chart_index(ttl_bucket: int) -> Dict[str, Tuple[Tuple[str, str, str, str, str], ...]]:
+    """
+    Fetch and parse the chart page into a per-airport index (cached per TTL bucket).
+    
+    Returns:
+        Dict mapping each ICAO code on the page to its chart rows, in page
+        order, as (airport cell, chart type, chart name, chart URL, category)
+    """
+    rows_by_icao = {}
+    
+    # Fetch the main page; errors are raised rather than returned so they are not cached
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    response = requests.get(BASE_URL, headers=headers, timeout=60)
+    response.raise_for_status()
+    
+    encoding = declared_encoding(response)
+    parser = lxml_html.HTMLParser(encoding=encoding) if encoding else None
+    tree = lxml_html.fromstring(response.content, parser=parser)
+    
+    for row in tree.iter('tr'):
+        cells = row.xpath('.//td')
+        if len(cells) < 8:
+            continue
         
-        soup = BeautifulSoup(response.text, 'lxml')
+        # First cell contains airport name with ICAO code
+        airport_cell = stripped_text(cells[0])
         
-        # Find all table rows
-        rows = soup.find_all('tr')
+        # Extract chart information
+        chart_type = stripped_text(cells[1])  # e.g., "Instrument Approach Chart"
+        chart_name = stripped_text(cells[2])  # e.g., "ILS Y RWY 03L"
         
-        for row in rows:
-            cells = row.find_all('td')
-            if len(cells) < 8:
-                continue
-            
-            # First cell contains airport name with ICAO code
-            airport_cell = cells[0].get_text(strip=True)
-            
-            # Check if this row belongs to our airport
-            # Format: "Airport Name - ICAO" or "Airport Name – ICAO" (different dash)
-            if icao_code not in airport_cell:
-                continue
-            
-            # Extract chart information
-            chart_type = cells[1].get_text(strip=True)  # e.g., "Instrument Approach Chart"
-            chart_name = cells[2].get_text(strip=True)  # e.g., "ILS Y RWY 03L"
-            chart_code = cells[3].get_text(strip=True)  # e.g., "ILS_02"
-            
-            # Find download link
-            link = row.find('a', href=True)
-            if not link:
-                continue
-            
-            chart_url = link['href']
-            
-            # Ensure full URL
-            if not chart_url.startswith('http'):
-                # Relative URL, build full path
-                if chart_url.startswith('/'):
-                    chart_url = BLOB_BASE + chart_url.split('/')[-1]
-                else:
-                    chart_url = BLOB_BASE + chart_url
-            
-            # URL encode spaces in filename
-            if ' ' in chart_url:
-                # Split URL and encode just the filename part
-                parts = chart_url.rsplit('/', 1)
-                if len(parts) == 2:
-                    base, filename = parts
-                    filename_encoded = quote(filename, safe='')
-                    chart_url = f"{base}/{filename_encoded}"
-            
-            # Build chart name
-            full_name = f"{icao_code} - {chart_name}"
-            if chart_type and chart_type not in chart_name:
-                # Add chart type if not redundant
-                if 'Chart' not in chart_name:
-                    full_name = f"{icao_code} - {chart_type}: {chart_name}"
-            
-            # Categorize
-            category = categorize_chart(chart_type, chart_name)
-            
-            charts.append({
-                'name': full_name,
-                'url': chart_url,
-                'type': category
-            })
+        # Find download link
+        hrefs = row.xpath('(.//a[@href])[1]/@href')
+        if not hrefs:
+            continue
         
-        return charts
+        chart_url = hrefs[0]
         
-    except Exception as e:
-        print(f"Error fetching charts for {icao_code}: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        # Ensure full URL
+        if not chart_url.startswith('http'):
+            # Relative URL, build full path
+            if chart_url.startswith('/'):
+                chart_url = BLOB_BASE + chart_url.split('/')[-1]
+            else:
+                chart_url = BLOB_BASE + chart_url
+        
+        # URL encode spaces in filename
+        if ' ' in chart_url:
+            # Split URL and encode just the filename part
+            parts = chart_url.rsplit('/', 1)
+            if len(parts) == 2:
+                base, filename = parts
+                filename_encoded = quote(filename, safe='')
+                chart_url = f"{base}/{filename_encoded}"
+        
+        # Categorize
+        category = categorize_chart(chart_type, chart_name)
+        
+        chart_row = (airport_cell, chart_type, chart_name, chart_url, category)
+        
+        # A row belongs to every airport code in its cell, e.g.
+        # "O.R Tambo INTL- FAOR" or "Airport Name – ICAO" (different dash)
+        for icao_code in dict.fromkeys(_ICAO_RE.findall(airport_cell)):
+            rows_by_icao.setdefault(icao_code, []).append(chart_row)
+    
+    return {icao_code: tuple(rows) for icao_code, rows in rows_by_icao.items()}
 
 
 def main():
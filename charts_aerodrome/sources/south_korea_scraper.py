@@ -5,24 +5,67 @@ Based on https://aim.koca.go.kr/
 """
 
 import requests
+import os
 import re
+import sys
+import time
+from functools import lru_cache
 from typing import List, Dict
-from bs4 import BeautifulSoup
+from lxml import etree
 from urllib.parse import quote
 from datetime import datetime
 
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, map_threaded, parse_streamed, stripped_text
+
+# The package index is re-read at most once per hour
+_CACHE_TTL = 3600
+
+# Package dates in the package index links, e.g. /Package/2026-01-08/html
+_PACKAGE_DATE_RE = re.compile(r'/Package/(\d{4}-\d{2}-\d{2})/html')
+# Package date in a chart PDF link, e.g. /Package/2026-01-08-AIRAC/...
+_PDF_DATE_RE = re.compile(r'/Package/(\d{4}-\d{2}-\d{2}(?:-AIRAC)?)')
+
+# Chart type keywords, checked in priority order against the chart name and
+# filename ("dep" also counts at the end of the name)
+_CATEGORY_PATTERNS = (
+    # SID (Standard Instrument Departure)
+    ('sid', re.compile(r'sid|departure|dep(?: |$)|area chart - icao\(dep\)|area chart\(dep\)', re.IGNORECASE)),
+    # STAR (Standard Terminal Arrival Route)
+    ('star', re.compile(
+        r'star|standard arrival|instrument arrival|area chart\(arr\)|area chart - icao\(arr\)',
+        re.IGNORECASE,
+    )),
+    # Approach charts
+    ('approach', re.compile(
+        r'app|apch|iac|ils|vor|ndb|rnav|rnp|landing|final|precision|atc surveillance minimum altitude',
+        re.IGNORECASE,
+    )),
+    # Airport/Ground charts
+    ('airport_diagram', re.compile(
+        r'aerodrome|airport|ground|parking|taxi|stand|apron|movement|agc|adc|ad chart'
+        r'|obstacle|terrain|bird concentration|docking',
+        re.IGNORECASE,
+    )),
+)
+
 
 class SouthKoreaScraper:
     """Scraper for South Korea AIM aerodrome charts."""
     
     BASE_URL = "https://aim.koca.go.kr"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
     
     def __init__(self, verbose: bool = False):
         self.verbose = verbose
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        # The pooled module session is shared by all instances, so the
+        # headers are sent per request rather than set on the session
+        self.session = SESSION
         self.package_date = None
     
     def _get_current_package_date(self):
@@ -31,34 +74,17 @@ class SouthKoreaScraper:
         Returns:
             Package date string like '2026-01-08' or None if not found
         """
-        if self.package_date:
-            return self.package_date
-            
         try:
             if self.verbose:
                 print("Finding current package date...")
             
-            # Try to get the menu page which should have the current package date
-            response = self.session.get(f"{self.BASE_URL}/eaipPub/Package/", timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find links with package dates (format: YYYY-MM-DD)
-            date_pattern = re.compile(r'/Package/(\d{4}-\d{2}-\d{2})/html')
-            
-            dates = []
-            for link in soup.find_all('a', href=True):
-                match = date_pattern.search(link['href'])
-                if match:
-                    dates.append(match.group(1))
-            
-            if dates:
-                # Get the most recent date
-                self.package_date = max(dates)
-                if self.verbose:
-                    print(f"Found current package date: {self.package_date}")
-                return self.package_date
+            # The date is cached per module, so all instances share one lookup
+            self.package_date = _fetch_package_date(int(time.time() // _CACHE_TTL))
+            if self.verbose:
+                print(f"Found current package date: {self.package_date}")
+            return self.package_date
             
+        except LookupError:
             if self.verbose:
                 print("Could not find package date, using fallback")
             return None
@@ -98,22 +124,28 @@ class SouthKoreaScraper:
             if self.verbose:
                 print(f"URL: {url}")
             
-            # Get the page
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            # Get the page, parsing it as it arrives
+            with self.session.get(url, headers=self.HEADERS, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                tree = parse_streamed(response)
             
-            # Parse HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # A whitespace-only page parses to no root at all
+            if tree is None:
+                if self.verbose:
+                    print(f"Empty page for {icao_code}")
+                return []
             
             # Find AD 2.24 section - "CHARTS RELATED TO THE AERODROME"
             ad_24_section = None
-            for heading in soup.find_all(['h4', 'h3', 'h2']):
-                if 'AD' in heading.get_text() and '2.24' in heading.get_text():
+            for heading in tree.xpath('//h2 | //h3 | //h4'):
+                heading_text = heading.text_content()
+                if 'AD' in heading_text and '2.24' in heading_text:
                     # Get the parent div or the next section
-                    ad_24_section = heading.find_parent('div')
+                    parent_divs = heading.xpath('ancestor::div[1]')
+                    ad_24_section = parent_divs[0] if parent_divs else None
                     break
             
-            if not ad_24_section:
+            if ad_24_section is None:
                 if self.verbose:
                     print("Could not find AD 2.24 section")
                 return []
@@ -121,8 +153,12 @@ class SouthKoreaScraper:
             if self.verbose:
                 print("Found AD 2.24 section")
             
-            # Find all PDF links in this section
-            all_pdf_links = ad_24_section.find_all('a', href=lambda x: x and '.pdf' in x.lower())
+            # Find all PDF links in this section, skipping deleted versions
+            # (links whose nearest enclosing div has class AmdtDeleted)
+            all_pdf_links = ad_24_section.xpath(
+                './/a[contains(translate(@href, "PDF", "pdf"), ".pdf")]'
+                '[not(ancestor::div[1][contains(concat(" ", normalize-space(@class), " "), " AmdtDeleted ")])]'
+            )
             
             if self.verbose:
                 print(f"Found {len(all_pdf_links)} PDF links in AD 2.24")
@@ -132,36 +168,27 @@ class SouthKoreaScraper:
             
             for link in all_pdf_links:
                 href = link.get('href', '')
-                name = link.get_text(strip=True)
+                name = stripped_text(link)
                 
                 if not name or not href:
                     continue
                 
                 # Extract date from href (format: /Package/YYYY-MM-DD-AIRAC/... or /Package/YYYY-MM-DD/...)
-                date_match = re.search(r'/Package/(\d{4}-\d{2}-\d{2}(?:-AIRAC)?)', href)
+                date_match = _PDF_DATE_RE.search(href)
                 if not date_match:
                     continue
                 
                 pdf_date = date_match.group(1).replace('-AIRAC', '')  # Normalize date
                 
-                # Check if this is a deleted version (should skip)
-                parent_div = link.find_parent('div')
-                if parent_div and 'AmdtDeleted' in parent_div.get('class', []):
-                    continue
-                
-                # Keep track of the most recent version of each chart
-                if name not in charts_by_name:
-                    charts_by_name[name] = {'href': href, 'date': pdf_date}
-                else:
-                    # Compare dates and keep the most recent
-                    if pdf_date > charts_by_name[name]['date']:
-                        charts_by_name[name] = {'href': href, 'date': pdf_date}
+                # Keep track of the most recent version of each chart as
+                # (date, href); on equal dates the first link is kept
+                current = charts_by_name.get(name)
+                if current is None or pdf_date > current[0]:
+                    charts_by_name[name] = (pdf_date, href)
             
             # Build final chart list
             charts = []
-            for name, data in charts_by_name.items():
-                href = data['href']
-                
+            for name, (_, href) in charts_by_name.items():
                 # URL encode the filename part (spaces become %20)
                 # Split URL to encode only the filename
                 parts = href.rsplit('/', 1)
@@ -195,6 +222,29 @@ class SouthKoreaScraper:
             if self.verbose:
                 print(f"Error fetching data for {icao_code}: {e}")
             return []
+        except (etree.ParserError, etree.XMLSyntaxError) as e:
+            # e.g. an empty response body
+            if self.verbose:
+                print(f"Error parsing page for {icao_code}: {e}")
+            return []
+    
+    def get_charts_batch(self, icao_codes: List[str], max_workers: int = 8) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Fetch aerodrome charts for several South Korean airports in parallel.
+        
+        Args:
+            icao_codes: ICAO codes of the airports (e.g., ['RKSI', 'RKSS'])
+            max_workers: Number of airport pages fetched in parallel
+            
+        Returns:
+            Dict mapping each upper-cased ICAO code to its list of charts
+        """
+        icao_codes = list(dict.fromkeys(code.upper() for code in icao_codes))
+        
+        # Resolve the package date once so the workers don't all race to fetch it
+        self._get_current_package_date()
+        
+        return dict(zip(icao_codes, map_threaded(self.get_charts, icao_codes, max_workers)))
     
     def _categorize_chart(self, name: str, filename: str) -> str:
         """
@@ -207,46 +257,52 @@ class SouthKoreaScraper:
         Returns:
             Chart type: 'general', 'airport_diagram', 'sid', 'star', or 'approach'
         """
-        name_lower = name.lower()
-        filename_lower = filename.lower()
-        combined = f"{name_lower} {filename_lower}"
-        
-        # SID (Standard Instrument Departure)
-        if any(keyword in combined for keyword in [
-            'sid', 'departure', 'dep ', 'standard departure', 'instrument departure', 'area chart - icao(dep)', 'area chart(dep)'
-        ]):
-            return 'sid'
-        
-        # STAR (Standard Terminal Arrival Route)
-        if any(keyword in combined for keyword in [
-            'star', 'standard arrival', 'instrument arrival', 'area chart(arr)', 'area chart - icao(arr)'
-        ]):
-            return 'star'
-        
-        # Approach charts
-        if any(keyword in combined for keyword in [
-            'approach', 'apch', 'app', 'iac', 'ils', 'vor', 'ndb', 'rnav', 'rnp', 
-            'landing', 'final', 'precision', 'non-precision', 'instr apch', 'visual apch',
-            'atc surveillance minimum altitude'
-        ]):
-            return 'approach'
-        
-        # Airport/Ground charts
-        if any(keyword in combined for keyword in [
-            'aerodrome', 'airport', 'ground', 'parking', 'taxi', 'stand',
-            'apron', 'movement', 'agc', 'adc', 'ad chart', 'obstacle', 'terrain',
-            'bird concentration', 'docking'
-        ]):
-            return 'airport_diagram'
+        # Name and filename are searched in turn rather than joined into one string
+        for category, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(name) or pattern.search(filename):
+                return category
         
         # Default to general
         return 'general'
 
 
+@lru_cache(maxsize=1)
+def _fetch_package_date(ttl_bucket):
+    """Find the most recent package date in the package index (cached per TTL bucket)."""
+    # Try to get the menu page which should have the current package date
+    package_index_url = f"{SouthKoreaScraper.BASE_URL}/eaipPub/Package/"
+    with SESSION.get(package_index_url, headers=SouthKoreaScraper.HEADERS, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        tree = parse_streamed(response)
+    
+    # Find the most recent of the links' package dates (format: YYYY-MM-DD)
+    latest_date = None
+    # A whitespace-only page parses to no root at all
+    hrefs = tree.xpath('//a/@href') if tree is not None else []
+    for href in hrefs:
+        match = _PACKAGE_DATE_RE.search(href)
+        if match and (latest_date is None or match.group(1) > latest_date):
+            latest_date = match.group(1)
+    
+    if latest_date is None:
+        # Raised rather than returned so a miss is not cached
+        raise LookupError("No package date found in the package index")
+    
+    return latest_date
+
+
+# Shared by the function-based interface
+_SCRAPER = SouthKoreaScraper(verbose=False)
+
+
 def get_aerodrome_charts(icao_code):
     """Wrapper function for compatibility with function-based interface."""
-    scraper = SouthKoreaScraper(verbose=False)
-    return scraper.get_charts(icao_code)
+    return _SCRAPER.get_charts(icao_code)
+
+
+def get_aerodrome_charts_many(icao_codes, max_workers=8):
+    """Wrapper for SouthKoreaScraper.get_charts_batch with the function-based interface."""
+    return _SCRAPER.get_charts_batch(icao_codes, max_workers)
 
 
 if __name__ == '__main__':
@@ -14,17 +14,29 @@ Structure:
 - Charts are served via API endpoint returning signed S3 URLs
 """
 
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, quote
+import os
 import re
+import sys
 import json
+import time
+from functools import lru_cache
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, map_threaded
 
 
 BASE_URL = "https://sscaa.co"
 TITLE_SHEET_URL = f"{BASE_URL}/part-0/aip-title-sheet/"
 PDF_ENDPOINT = f"{BASE_URL}/endpoints/main-getpdf-endpoint.html"
 
+# The title sheet is re-read at most once per hour
+_CACHE_TTL = 3600
+
 # Mapping of ICAO codes to their URL slugs (from navigation)
 # Only airports with AD 2.24 charts section are useful
 AIRPORT_SLUGS = {
@@ -49,6 +61,35 @@ AIRPORT_SLUGS = {
     'HJYL': 'hjyl-yirol',
 }
 
+# AD 2.24 charts page of each airport, built once from its slug
+_AIRPORT_URLS = {
+    icao: f"{BASE_URL}/part-3-aerodromes-(ad)/ad-2-aerodromes/{slug}/ad-2.24-charts/"
+    for icao, slug in AIRPORT_SLUGS.items()
+}
+
+# Chart page filenames start with an airport ICAO code, e.g. hjjj-aerodrome-chart-icao.html
+_CHART_FILENAME_RE = re.compile(r'hj[a-z]{2}-')
+# Chart ID and title set by the chart page's script
+_DATAJSON_ID_RE = re.compile(r"dataJSON\.id\s*=\s*'(\d+)'")
+_DATAJSON_TITLE_RE = re.compile(r"dataJSON\.pagetitle\s*=\s*'([^']+)'")
+# Chart number prefix of a page title, e.g. "HJJJ-01 "
+_CHART_NUMBER_RE = re.compile(r'^[A-Z]{4}-\d+ ')
+# Airport links in the navigation, e.g. /ad-2-aerodromes/hjjj-juba/
+_AIRPORT_LINK_RE = re.compile(r'/ad-2-aerodromes/(hj[a-z]{2})-([^/]+)/')
+
+# Chart type keywords, one alternation per category in priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|DEPARTURE', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|ARRIVAL', re.IGNORECASE)),
+    ('Approach', re.compile(r'APPROACH|ILS|LOC|VOR|DME|RNP|RNAV|NDB', re.IGNORECASE)),
+    ('Airport Diagram', re.compile(r'AERODROME CHART|AIRPORT CHART|PARKING|GROUND|TAXI', re.IGNORECASE)),
+)
+# Coding tables are supporting docs, so the approach keywords don't count
+# in a name that mentions one
+_CODING_TABLE_PATTERNS = tuple(
+    (category, pattern) for category, pattern in _CATEGORY_PATTERNS if category != 'Approach'
+)
+
 
 def categorize_chart(chart_name):
     """
@@ -60,28 +101,10 @@ def categorize_chart(chart_name):
     Returns:
         Category string: 'SID', 'STAR', 'Approach', 'Airport Diagram', or 'General'
     """
-    name_upper = chart_name.upper()
-    
-    # SID - Standard Instrument Departure
-    if 'SID' in name_upper or 'DEPARTURE' in name_upper:
-        return 'SID'
-    
-    # STAR - Standard Terminal Arrival
-    if 'STAR' in name_upper or 'ARRIVAL' in name_upper:
-        return 'STAR'
-    
-    # Approach charts (but not coding tables which are supporting docs)
-    if any(kw in name_upper for kw in ['APPROACH', 'ILS', 'LOC', 'VOR', 'DME', 'RNP', 'RNAV', 'NDB']):
-        # Coding tables are supporting docs, not approach charts
-        if 'CODING TABLE' not in name_upper:
-            return 'Approach'
-    
-    # Airport diagrams (aerodrome chart, parking, ground movement)
-    if any(kw in name_upper for kw in ['AERODROME CHART', 'AIRPORT CHART', 'PARKING', 'GROUND', 'TAXI']):
-        return 'Airport Diagram'
-    
-    # General/Other (minimums, coding tables, AMA, etc.)
-    return 'General'
+    if 'CODING TABLE' in chart_name.upper():
+        return categorize_by_patterns(chart_name, _CODING_TABLE_PATTERNS, 'General')
+    # Anything unmatched (minimums, coding tables, AMA, etc.) is general
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_airport_charts_url(icao_code):
@@ -94,13 +117,7 @@ def get_airport_charts_url(icao_code):
     Returns:
         URL string or None if airport not found
     """
-    icao_upper = icao_code.upper()
-    
-    if icao_upper not in AIRPORT_SLUGS:
-        return None
-    
-    slug = AIRPORT_SLUGS[icao_upper]
-    return f"{BASE_URL}/part-3-aerodromes-(ad)/ad-2-aerodromes/{slug}/ad-2.24-charts/"
+    return _AIRPORT_URLS.get(icao_code.upper())
 
 
 def get_chart_pages(charts_url):
@@ -114,14 +131,16 @@ def get_chart_pages(charts_url):
         List of tuples: (chart_page_url, chart_name_from_link)
     """
     try:
-        response = requests.get(charts_url, timeout=30)
+        response = SESSION.get(charts_url, timeout=30)
         if response.status_code == 404:
             return []
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'lxml')
         
-        chart_pages = []
+        # Chart page URL -> name; the first link to each page wins and
+        # insertion order keeps the pages in document order
+        chart_pages = {}
         
         # Find links to chart pages (they end with .html and contain ICAO code)
         for link in soup.find_all('a', href=True):
@@ -143,7 +162,7 @@ def get_chart_pages(charts_url):
                 continue
             
             # Must start with airport ICAO code pattern (hjXX-)
-            if not re.match(r'^hj[a-z]{2}-', filename):
+            if not _CHART_FILENAME_RE.match(filename):
                 continue
             
             # Extract chart name from link text or filename
@@ -156,17 +175,9 @@ def get_chart_pages(charts_url):
             # The href contains full relative path like: part-3-aerodromes-(ad)/ad-2-aerodromes/hjjj-juba/ad-2.24-charts/hjjj-aerodrome-chart-icao.html
             full_url = f"{BASE_URL}/{href}"
             
-            chart_pages.append((full_url, link_text))
+            chart_pages.setdefault(full_url, link_text)
         
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_pages = []
-        for url, name in chart_pages:
-            if url not in seen:
-                seen.add(url)
-                unique_pages.append((url, name))
-        
-        return unique_pages
+        return list(chart_pages.items())
         
     except Exception as e:
         print(f"Error fetching chart pages: {e}")
@@ -184,17 +195,17 @@ def extract_chart_info(chart_page_url):
         Tuple: (chart_id, pagetitle) or (None, None) if not found
     """
     try:
-        response = requests.get(chart_page_url, timeout=30)
+        response = SESSION.get(chart_page_url, timeout=30)
         response.raise_for_status()
         
         html = response.text
         
         # Extract dataJSON.id
-        id_match = re.search(r"dataJSON\.id\s*=\s*'(\d+)'", html)
+        id_match = _DATAJSON_ID_RE.search(html)
         chart_id = id_match.group(1) if id_match else None
         
         # Extract dataJSON.pagetitle
-        title_match = re.search(r"dataJSON\.pagetitle\s*=\s*'([^']+)'", html)
+        title_match = _DATAJSON_TITLE_RE.search(html)
         pagetitle = title_match.group(1) if title_match else None
         
         return chart_id, pagetitle
@@ -221,14 +232,15 @@ def get_signed_pdf_url(chart_id, pagetitle):
             'pagetitle': pagetitle
         }
         
-        response = requests.post(
+        response = SESSION.post(
             PDF_ENDPOINT,
             json=payload,
             timeout=30
         )
         response.raise_for_status()
         
-        data = response.json()
+        # json.loads detects the UTF encoding of the raw bytes itself
+        data = json.loads(response.content)
         return data.get('signedURL')
         
     except Exception as e:
@@ -236,12 +248,38 @@ def get_signed_pdf_url(chart_id, pagetitle):
         return None
 
 
-def get_aerodrome_charts(icao_code):
+def resolve_chart_pdf(page_url):
+    """
+    Resolve the signed PDF URL of one chart page.
+    
+    Args:
+        page_url: URL to individual chart page
+        
+    Returns:
+        Tuple: (pagetitle, signed_pdf_url) or None if either step failed
+    """
+    # Extract chart ID and title from page
+    chart_id, pagetitle = extract_chart_info(page_url)
+    
+    if not chart_id or not pagetitle:
+        return None
+    
+    # Get signed PDF URL
+    pdf_url = get_signed_pdf_url(chart_id, pagetitle)
+    
+    if not pdf_url:
+        return None
+    
+    return pagetitle, pdf_url
+
+
+def get_aerodrome_charts(icao_code, max_workers=8):
     """
     Get all aerodrome charts for a given ICAO code from South Sudan AIP.
     
     Args:
         icao_code: 4-letter ICAO code (e.g., 'HJJJ')
+        max_workers: Number of chart pages resolved in parallel
         
     Returns:
         List of dictionaries with 'name', 'url', and 'type' keys
@@ -249,8 +287,8 @@ def get_aerodrome_charts(icao_code):
     icao_upper = icao_code.upper()
     charts = []
     
-    # Get charts URL for this airport
-    charts_url = get_airport_charts_url(icao_upper)
+    # Get charts URL for this airport (the code is already upper-cased)
+    charts_url = _AIRPORT_URLS.get(icao_upper)
     
     if not charts_url:
         print(f"Airport {icao_upper} not found in South Sudan AIP")
@@ -264,28 +302,19 @@ def get_aerodrome_charts(icao_code):
         print(f"No charts found for {icao_upper} (airport may not have AD 2.24 section)")
         return charts
     
-    # Process each chart page
-    for page_url, link_name in chart_pages:
-        # Extract chart ID and title from page
-        chart_id, pagetitle = extract_chart_info(page_url)
-        
-        if not chart_id or not pagetitle:
+    # Each chart needs a page GET and an endpoint POST that don't depend on
+    # the other charts, so the pages are resolved in parallel
+    resolved = map_threaded(resolve_chart_pdf, [page_url for page_url, _ in chart_pages], max_workers)
+    
+    for result in resolved:
+        if not result:
             continue
         
-        # Get signed PDF URL
-        pdf_url = get_signed_pdf_url(chart_id, pagetitle)
+        pagetitle, pdf_url = result
         
-        if not pdf_url:
-            continue
-        
-        # Clean up chart name from pagetitle
+        # Clean up chart name from pagetitle by removing the ICAO-XX prefix
         # Format: "HJJJ-01 AERODROME CHART - ICAO" -> "AERODROME CHART - ICAO"
-        chart_name = pagetitle
-        if '-' in chart_name:
-            # Remove ICAO-XX prefix
-            parts = chart_name.split(' ', 1)
-            if len(parts) > 1 and re.match(r'^[A-Z]{4}-\d+$', parts[0]):
-                chart_name = parts[1]
+        chart_name = _CHART_NUMBER_RE.sub('', pagetitle, count=1)
         
         # Categorize chart
         chart_type = categorize_chart(chart_name)
@@ -306,36 +335,40 @@ def list_available_airports():
     Returns:
         List of tuples: (icao_code, airport_name)
     """
-    airports = []
-    
     try:
-        response = requests.get(TITLE_SHEET_URL, timeout=30)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # Find airport links in navigation
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            
-            # Match airport links pattern
-            match = re.search(r'/ad-2-aerodromes/(hj[a-z]{2})-([^/]+)/', href)
-            if match:
-                icao = match.group(1).upper()
-                name = match.group(2).replace('-', ' ').title()
-                airports.append((icao, name))
-        
-        # Remove duplicates
-        airports = list(set(airports))
-        airports.sort()
-        
-        return airports
+        return list(_fetch_airport_list(int(time.time() // _CACHE_TTL)))
         
     except Exception as e:
         print(f"Error listing airports: {e}")
         return list(AIRPORT_SLUGS.items())
 
 
+@lru_cache(maxsize=1)
+def _fetch_airport_list(ttl_bucket):
+    """Read the airports from the title sheet navigation (cached per TTL bucket)."""
+    airports = []
+    
+    # Errors are raised rather than returned so they are not cached
+    response = SESSION.get(TITLE_SHEET_URL, timeout=30)
+    response.raise_for_status()
+    
+    soup = BeautifulSoup(response.text, 'lxml')
+    
+    # Find airport links in navigation
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        
+        # Match airport links pattern
+        match = _AIRPORT_LINK_RE.search(href)
+        if match:
+            icao = match.group(1).upper()
+            name = match.group(2).replace('-', ' ').title()
+            airports.append((icao, name))
+    
+    # Remove duplicates
+    return tuple(sorted(set(airports)))
+
+
 # For CLI testing
 if __name__ == '__main__':
     import sys
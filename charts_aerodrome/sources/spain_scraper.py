@@ -5,41 +5,53 @@ Scrapes aerodrome charts from Spain's ENAIRE AIP
 """
 
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, quote
+import os
 import re
 import sys
+import time
+from functools import lru_cache
+
+if not __package__:
+    # Run as a script: put charts_aerodrome on the path so the sources package imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources._common import SESSION, categorize_by_patterns, parse_streamed, stripped_text
 
 
 BASE_URL = "https://aip.enaire.es/aip/"
+AIP_PAGE_URL = f"{BASE_URL}aip-en.html"
+
+# Every airport is on the same page, which is re-read at most once per hour
+_CACHE_TTL = 3600
+
+_WS_RE = re.compile(r'\s+')
+
+# Chart type keywords (English and Spanish), one alternation per category in
+# priority order
+_CATEGORY_PATTERNS = (
+    ('SID', re.compile(r'SID|STANDARD DEPARTURE|STANDARD INSTRUMENT DEPARTURE|SALIDA', re.IGNORECASE)),
+    ('STAR', re.compile(r'STAR|STANDARD ARRIVAL|STANDARD INSTRUMENT ARRIVAL|LLEGADA', re.IGNORECASE)),
+    ('Approach', re.compile(
+        r'APPROACH|ILS|LOC|NDB|RNP|GLS|VOR|RNAV|DME|APROXIMACIÓN|APROXIMACION|IAC',
+        re.IGNORECASE,
+    )),
+    ('Airport Diagram', re.compile(
+        r'AERODROME CHART|GROUND MOVEMENT|PARKING|AIRCRAFT PARKING|DOCKING|PLANO',
+        re.IGNORECASE,
+    )),
+)
 
 
 def get_airport_page_url(icao_code):
     """Get the URL for a specific airport's page"""
     # Spain uses fragment-based navigation: aip-en.html#{ICAO}
-    return f"{BASE_URL}aip-en.html#{icao_code}"
+    return f"{AIP_PAGE_URL}#{icao_code}"
 
 
 def categorize_chart(chart_name):
     """Categorize chart based on its name"""
-    chart_name_upper = chart_name.upper()
-    
-    if 'SID' in chart_name_upper or 'STANDARD DEPARTURE' in chart_name_upper or 'STANDARD INSTRUMENT DEPARTURE' in chart_name_upper or 'SALIDA' in chart_name_upper:
-        return 'SID'
-    elif 'STAR' in chart_name_upper or 'STANDARD ARRIVAL' in chart_name_upper or 'STANDARD INSTRUMENT ARRIVAL' in chart_name_upper or 'LLEGADA' in chart_name_upper:
-        return 'STAR'
-    elif 'APPROACH' in chart_name_upper or 'ILS' in chart_name_upper or 'LOC' in chart_name_upper \
-            or 'NDB' in chart_name_upper or 'RNP' in chart_name_upper or 'GLS' in chart_name_upper \
-            or 'VOR' in chart_name_upper or 'RNAV' in chart_name_upper or 'DME' in chart_name_upper \
-            or 'APROXIMACIÓN' in chart_name_upper or 'APROXIMACION' in chart_name_upper \
-            or 'IAC' in chart_name_upper:
-        return 'Approach'
-    elif 'AERODROME CHART' in chart_name_upper or 'GROUND MOVEMENT' in chart_name_upper \
-            or 'PARKING' in chart_name_upper or 'AIRCRAFT PARKING' in chart_name_upper \
-            or 'DOCKING' in chart_name_upper or 'PLANO' in chart_name_upper:
-        return 'Airport Diagram'
-    else:
-        return 'General'
+    return categorize_by_patterns(chart_name, _CATEGORY_PATTERNS, 'General')
 
 
 def get_aerodrome_charts(icao_code):
@@ -55,75 +67,14 @@ def get_aerodrome_charts(icao_code):
     charts = []
     
     try:
-        # Get airport page URL
-        airport_url = get_airport_page_url(icao_code)
-        
-        # Get the airport page
-        # Note: This page uses JavaScript/fragments, but we can still try to parse it
-        response = requests.get(airport_url, timeout=30)
-        if response.status_code != 200:
-            print(f"Error: Got status code {response.status_code}")
-            return charts
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find all links with class "far fa-file-pdf"
-        # These are the PDF chart links
-        pdf_links = soup.find_all('i', class_='far fa-file-pdf')
-        
-        seen_urls = set()
-        
-        for pdf_icon in pdf_links:
-            # The PDF icon is inside an <a> tag
-            link = pdf_icon.find_parent('a')
-            if not link or not link.get('href'):
-                continue
-            
-            href = link.get('href')
-            
+        # The page is the same for every airport, so its chart links are
+        # extracted once per TTL bucket and only filtered here
+        for href, chart_name, full_url, chart_type in _fetch_chart_links(int(time.time() // _CACHE_TTL)):
             # Filter by ICAO code - only include charts that belong to this airport
             # Chart URLs are like: contenido_AIP/AD/AD2/LEMD/LE_AD_2_LEMD_...pdf
             if icao_code not in href:
                 continue
             
-            # Get the chart name
-            # Try to find the name in the link text or nearby elements
-            chart_name = link.get_text(strip=True)
-            
-            # If the link itself doesn't have text, look for nearby text
-            if not chart_name or chart_name == '':
-                # Look for text in parent elements
-                parent = link.find_parent(['li', 'div', 'td', 'tr'])
-                if parent:
-                    # Get all text but remove the icon classes
-                    chart_name = parent.get_text(strip=True)
-                    # Clean up icon text
-                    chart_name = re.sub(r'\s+', ' ', chart_name)
-            
-            # If still no name, use the filename
-            if not chart_name or chart_name == '':
-                chart_name = href.split('/')[-1].replace('.pdf', '')
-            
-            # Skip if we've already seen this URL
-            if href in seen_urls:
-                continue
-            
-            seen_urls.add(href)
-            
-            # Build full URL
-            full_url = urljoin(BASE_URL, href)
-            
-            # URL encode if needed
-            if ' ' in full_url:
-                url_parts = full_url.rsplit('/', 1)
-                if len(url_parts) == 2:
-                    base_url_part, filename = url_parts
-                    encoded_filename = quote(filename, safe='')
-                    full_url = f"{base_url_part}/{encoded_filename}"
-            
-            # Categorize the chart
-            chart_type = categorize_chart(chart_name)
-            
             charts.append({
                 'name': chart_name,
                 'url': full_url,
@@ -132,6 +83,9 @@ def get_aerodrome_charts(icao_code):
         
         return charts
         
+    except requests.exceptions.HTTPError as e:
+        print(f"Error: {e}")
+        return charts
     except Exception as e:
         print(f"Error fetching charts: {e}")
         import traceback
@@ -139,6 +93,81 @@ def get_aerodrome_charts(icao_code):
         return charts
 
 
+@lru_cache(maxsize=1)
+def _fetch_chart_links(ttl_bucket):
+    """
+    Fetch the AIP page and extract every PDF chart link (cached per TTL bucket).
+    
+    Only the extracted links are kept, so the parsed page is released as soon
+    as they are read.
+    
+    Returns:
+        Tuple of (href, chart name, full URL, chart type) per distinct href,
+        in page order
+    """
+    links = []
+    
+    # Get the page, parsing it as it arrives; the airport fragment of
+    # get_airport_page_url is never sent to the server, so it is left out
+    # Note: This page uses JavaScript/fragments, but we can still try to parse it
+    with SESSION.get(AIP_PAGE_URL, timeout=30, stream=True) as response:
+        if response.status_code != 200:
+            # Raised rather than returned so the failure is not cached
+            raise requests.exceptions.HTTPError(f"Got status code {response.status_code}", response=response)
+        
+        tree = parse_streamed(response)
+    
+    # The PDF chart links are the <a> tags holding an icon with class "far fa-file-pdf"
+    pdf_links = tree.xpath('//a[@href != ""][.//i[normalize-space(@class) = "far fa-file-pdf"]]')
+    
+    seen_urls = set()
+    
+    for link in pdf_links:
+        href = link.get('href')
+        
+        # Skip if we've already seen this URL
+        if href in seen_urls:
+            continue
+        
+        seen_urls.add(href)
+        
+        # Get the chart name
+        # Try to find the name in the link text or nearby elements
+        chart_name = stripped_text(link)
+        
+        # If the link itself doesn't have text, look for nearby text
+        if not chart_name:
+            # Look for text in parent elements
+            parent = link.xpath('ancestor::*[self::li or self::div or self::td or self::tr][1]')
+            if parent:
+                # Get all text but remove the icon classes
+                chart_name = stripped_text(parent[0])
+                # Clean up icon text
+                chart_name = _WS_RE.sub(' ', chart_name)
+        
+        # If still no name, use the filename
+        if not chart_name:
+            chart_name = href.split('/')[-1].replace('.pdf', '')
+        
+        # Build full URL
+        full_url = urljoin(BASE_URL, href)
+        
+        # URL encode if needed
+        if ' ' in full_url:
+            url_parts = full_url.rsplit('/', 1)
+            if len(url_parts) == 2:
+                base_url_part, filename = url_parts
+                encoded_filename = quote(filename, safe='')
+                full_url = f"{base_url_part}/{encoded_filename}"
+        
+        # Categorize the chart
+        chart_type = categorize_chart(chart_name)
+        
+        links.append((href, chart_name, full_url, chart_type))
+    
+    return tuple(links)
+
+
 if __name__ == '__main__':
     # Test with Madrid (LEMD)
     if len(sys.argv) > 1: